@@ -0,0 +1,32 @@
+"""Micro-benchmarks for the hot paths of dsdrv.
+
+Run them from the repository root, e.g.:
+
+    python -m benchmarks.decoder
+"""
+
+import random
+import time
+
+
+def random_report(size, seed=0):
+    """Returns a reproducible buffer filled with random report data."""
+    rng = random.Random(seed)
+    return bytearray(rng.randrange(256) for _ in range(size))
+
+
+def rate(func, duration=1.0):
+    """Calls func repeatedly for about duration seconds.
+
+    Returns the number of calls per second.
+    """
+    calls, batch = 0, 100
+    start = time.perf_counter()
+    while True:
+        for _ in range(batch):
+            func()
+        calls += batch
+
+        elapsed = time.perf_counter() - start
+        if elapsed >= duration:
+            return calls / elapsed
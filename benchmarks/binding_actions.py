@@ -0,0 +1,93 @@
+"""Measures how many binding actions per second are turned into the
+arguments of their action function.
+
+    python -m benchmarks.binding_actions [seconds]
+
+Compares substituting the variables into the action string and splitting
+it on every trigger with the ActionTemplates parsed when the options are
+loaded, for the exec actions of the example dsdrv.conf and one without
+variables. Both have to give the same arguments.
+"""
+
+import re
+import shlex
+import sys
+
+from argparse import Namespace
+from types import SimpleNamespace
+from unittest import mock
+
+from dsdrv.actions.binding import ReportActionBinding, parse_action
+from dsdrv.controllers import controllers
+from dsdrv.device import get_decoder
+from dsdrv.eventloop import EventLoop
+from dsdrv.executor import ActionExecutor
+
+from . import random_report, rate
+
+ACTIONS = (
+    "exec echo '$name'",
+    "exec-background sh -c 'echo \"disconnect $device_addr\" | bluetoothctl'",
+    "exec notify-send 'Battery $report.battery' '$profile'",
+    "next-profile",
+)
+
+
+def legacy_args(controller, report, action):
+    """handle_binding_action before ActionTemplate, without running the
+    action."""
+    info = dict(name=controller.device.name,
+                profile=controller.current_profile,
+                device_addr=controller.device.device_addr,
+                report=report)
+
+    def replace_var(match):
+        var, attr = match.group("var", "attr")
+        var = info.get(var)
+        if attr:
+            var = getattr(var, attr, None)
+        return str(var)
+
+    action = re.sub(r"\$(?P<var>\w+)(\.(?P<attr>\w+))?",
+                    replace_var, action)
+    action_split = shlex.split(action)
+    func = ReportActionBinding.actions.get(action_split[0])
+
+    return func, action_split[1:]
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+
+    controller = SimpleNamespace(
+        loop=EventLoop(), logger=mock.Mock(), profiles=[],
+        bindings={"global": []}, executor=ActionExecutor(),
+        current_profile="default",
+        device=SimpleNamespace(name="Sony Wireless Controller",
+                               device_addr="00:11:22:33:44:55"),
+        default_profile=Namespace(profile_toggle=None))
+    action = ReportActionBinding(controller)
+    report = get_decoder(controllers.DualShock4).decode(random_report(64))
+
+    print("{0:<42} {1:>14} {2:>14} {3:>8}".format(
+        "action", "before (a/s)", "after (a/s)", "speedup"))
+
+    for string in ACTIONS:
+        template = parse_action(string)
+        assert (legacy_args(controller, report, string) ==
+                (template.func,
+                 list(action.expand_args(template, report)))), string
+
+        before = rate(lambda: legacy_args(controller, report, string),
+                      duration)
+        after = rate(lambda: (template.func,
+                              action.expand_args(template, report)),
+                     duration)
+
+        name = string if len(string) <= 42 else string[:39] + "..."
+        print("{0:<42} {1:>14,.0f} {2:>14,.0f} {3:>7.2f}x".format(
+            name, before, after, after / before))
+
+
+if __name__ == "__main__":
+    main()
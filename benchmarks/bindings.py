@@ -0,0 +1,133 @@
+"""Measures how many reports ReportActionBinding.handle_report() handles
+per second.
+
+    python -m benchmarks.bindings [bindings] [seconds]
+
+Compares the matcher that looked up the buttons of every binding on
+every report with the one that compares button masks, and only when the
+buttons changed, for a bindings section of two button combos (default
+64). The buttons of the report stream change every BUTTON_INTERVAL
+reports, both matchers have to call the same bindings in the same order.
+"""
+
+import random
+import sys
+
+from argparse import Namespace
+from itertools import chain
+from types import SimpleNamespace
+from unittest import mock
+
+from dsdrv.actions.binding import ReportActionBinding, parse_bindings
+from dsdrv.controllers import controllers
+from dsdrv.device import BUTTON_FIELDS, get_decoder, set_buttons
+from dsdrv.eventloop import EventLoop
+from dsdrv.executor import ActionExecutor
+
+from . import random_report, rate
+
+REPORTS = 1024
+BUTTON_INTERVAL = 16
+
+
+class LegacyBinding(ReportActionBinding):
+    """Checks the buttons of every binding on every report."""
+
+    def add_binding(self, combo, callback, *args):
+        self.bindings.append((combo[:-1], combo[-1], callback, args))
+
+    def handle_report(self, report):
+        for binding in self.bindings:
+            modifiers = True
+            for button in binding[0]:
+                modifiers = modifiers and getattr(report, button)
+
+            active = getattr(report, binding[1])
+            released = not active
+
+            if modifiers and active and binding not in self.active:
+                self.active.add(binding)
+            elif released and binding in self.active:
+                self.active.remove(binding)
+                binding[2](report, *binding[3])
+
+
+def create_bindings(count):
+    rng = random.Random(0)
+    combos = set()
+    while len(combos) < count:
+        combos.add(tuple(rng.sample(BUTTON_FIELDS, 2)))
+
+    return dict((combo, "exec true {0}".format(i))
+                for i, combo in enumerate(sorted(combos)))
+
+
+def report_stream(bindings):
+    """Reports that hold some of the buttons of a binding, changing
+    every BUTTON_INTERVAL reports."""
+    decoder = get_decoder(controllers.DualShock4)
+    rng = random.Random(1)
+    combos = sorted(bindings)
+    reports = []
+
+    for i in range(REPORTS // BUTTON_INTERVAL):
+        buttons = [button for button in rng.choice(combos)
+                   if rng.random() < 0.8]
+        mask = sum(1 << BUTTON_FIELDS.index(button) for button in buttons)
+
+        buf = random_report(64, i)
+        buf[5], buf[6], buf[7] = 0x08, 0, buf[7] & 0xfc
+        for j in range(BUTTON_INTERVAL):
+            report = decoder.decode(buf)
+            set_buttons(report, mask, True)
+            reports.append(report)
+
+    return reports
+
+
+def create_action(action_class, bindings):
+    controller = SimpleNamespace(
+        loop=EventLoop(), logger=mock.Mock(), profiles=[],
+        bindings={"global": parse_bindings("global", bindings)},
+        executor=ActionExecutor(),
+        default_profile=Namespace(profile_toggle=None))
+
+    action = action_class(controller)
+    calls = []
+    action.handle_binding_action = lambda report, action: calls.append(action)
+    controller.loop.fire_event("load-options",
+                               Namespace(bindings=None, action_queue_size=16))
+
+    return action, calls
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    bindings = create_bindings(count)
+    reports = report_stream(bindings)
+
+    legacy, legacy_calls = create_action(LegacyBinding, bindings)
+    masked, masked_calls = create_action(ReportActionBinding, bindings)
+    for report in reports:
+        legacy.handle_report(report)
+        masked.handle_report(report)
+
+    assert legacy_calls == masked_calls
+    assert masked_calls, "no binding was called"
+
+    print("{0} bindings, {1} called over {2} reports".format(
+        count, len(masked_calls), len(reports)))
+
+    stream = chain.from_iterable(iter(lambda: reports, None))
+    before = rate(lambda: legacy.handle_report(next(stream)), duration)
+    after = rate(lambda: masked.handle_report(next(stream)), duration)
+
+    print("{0:>14} {1:>14} {2:>8}".format(
+        "before (r/s)", "after (r/s)", "speedup"))
+    print("{0:>14,.0f} {1:>14,.0f} {2:>7.2f}x".format(
+        before, after, after / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compares the precompiled ReportDecoder to the old parse_report.
+
+    python -m benchmarks.decoder [seconds]
+"""
+
+import sys
+
+from dsdrv.controllers import controllers
+from dsdrv.device import DSReport, SENSOR_FIELDS, get_decoder
+from dsdrv.utils import zero_copy_slice
+
+from . import random_report, rate
+
+
+class LegacyReport(object):
+    """DSReport without the sensor values, like the old parser used."""
+
+    __slots__ = [key for key in DSReport.__slots__
+                 if key not in SENSOR_FIELDS]
+
+    def __init__(self, *args, **kwargs):
+        for i, value in enumerate(args):
+            setattr(self, self.__slots__[i], value)
+
+
+def legacy_parse_report(controller, buf):
+    """DSDevice.parse_report as it was before ReportDecoder.
+
+    The second touch point is read from touchpad_start + 4 like the
+    decoder does, so the results can be compared.
+    """
+    dpad = buf[controller.value.dpadByte] % 16
+
+    return LegacyReport(
+        buf[controller.value.lstick_start], buf[controller.value.lstick_start+1],
+        buf[controller.value.rstick_start], buf[controller.value.rstick_start+1],
+        buf[controller.value.l2_analog], buf[controller.value.r2_analog],
+        (dpad in (0, 1, 7)), (dpad in (3, 4, 5)),
+        (dpad in (5, 6, 7)), (dpad in (1, 2, 3)),
+        (buf[controller.value.symbols] & 32) != 0,
+        (buf[controller.value.symbols] & 64) != 0,
+        (buf[controller.value.symbols] & 16) != 0,
+        (buf[controller.value.symbols] & 128) != 0,
+        (buf[controller.value.rl_digital] & 1) != 0,
+        (buf[controller.value.rl_digital] & 4) != 0,
+        (buf[controller.value.rl_digital] & 64) != 0,
+        (buf[controller.value.rl_digital] & 2) != 0,
+        (buf[controller.value.rl_digital] & 8) != 0,
+        (buf[controller.value.rl_digital] & 128) != 0,
+        (buf[controller.value.rl_digital] & 16) != 0,
+        (buf[controller.value.rl_digital] & 32) != 0,
+        (buf[controller.value.trackpadps] & 2) != 0,
+        (buf[controller.value.trackpadps] & 1) != 0,
+        buf[controller.value.touchpad_start] & 0x7f,
+        (buf[controller.value.touchpad_start] >> 7) == 0,
+        ((buf[controller.value.touchpad_start+2] & 0x0f) << 8) |
+        buf[controller.value.touchpad_start+1],
+        buf[controller.value.touchpad_start+3] << 4 |
+        ((buf[controller.value.touchpad_start+2] & 0xf0) >> 4),
+        buf[controller.value.touchpad_start+4] & 0x7f,
+        (buf[controller.value.touchpad_start+4] >> 7) == 0,
+        ((buf[controller.value.touchpad_start+6] & 0x0f) << 8) |
+        buf[controller.value.touchpad_start+5],
+        buf[controller.value.touchpad_start+7] << 4 |
+        ((buf[controller.value.touchpad_start+6] & 0xf0) >> 4),
+        buf[controller.value.trackpadps] >> 2,
+        buf[controller.value.batt_and_in] % 16,
+        (buf[controller.value.batt_and_in] & 16) != 0,
+        (buf[controller.value.batt_and_in] & 32) != 0,
+        (buf[controller.value.batt_and_in] & 64) != 0
+    )
+
+
+CASES = [
+    ("DualShock4 USB", controllers.DualShock4, 0, 64),
+    ("DualShock4 Bluetooth", controllers.DualShock4, 2, 78),
+    ("DualSense USB", controllers.DualSense, 0, 64),
+    ("DualSense Bluetooth", controllers.DualSense, 1, 78),
+]
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+
+    print("{0:<22} {1:>14} {2:>14} {3:>8} {4:>16}".format(
+        "report", "before (r/s)", "after (r/s)", "speedup",
+        "all values (r/s)"))
+
+    for name, controller, offset, size in CASES:
+        buf = random_report(size)
+        decoder = get_decoder(controller, offset)
+
+        # Both implementations have to agree before timing them
+        legacy = legacy_parse_report(controller, zero_copy_slice(buf, offset))
+        report = decoder.decode(buf)
+        for key in LegacyReport.__slots__:
+            assert getattr(legacy, key) == getattr(report, key), key
+
+        before = rate(lambda: legacy_parse_report(
+            controller, zero_copy_slice(buf, offset)), duration)
+        after = rate(lambda: decoder.decode(buf), duration)
+
+        # Also decode the lazily decoded values, like --dump-reports does
+        def decode_all():
+            report = decoder.decode(buf)
+            report.trackpad_touch0_id, report.battery
+
+        after_all = rate(decode_all, duration)
+
+        print("{0:<22} {1:>14,.0f} {2:>14,.0f} {3:>7.2f}x {4:>16,.0f}".format(
+            name, before, after, after / before, after_all))
+
+
+if __name__ == "__main__":
+    main()
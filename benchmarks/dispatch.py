@@ -0,0 +1,79 @@
+"""Measures the overhead of firing events to the registered handlers.
+
+    python -m benchmarks.dispatch [handlers]
+
+Compares the old queue based dispatching with the dispatch table of
+EventLoop, for a device-report event with a few no-op handlers (default
+7, like the actions of a controller) and for an event fired by another
+handler, which both handle before returning to the outer handlers.
+"""
+
+import sys
+
+from collections import defaultdict, deque
+
+from dsdrv.eventloop import EventLoop
+from dsdrv.utils import iter_except
+
+from . import rate
+
+
+class LegacyEvents(object):
+    """The event handling of EventLoop before the dispatch table."""
+
+    def __init__(self):
+        self.event_queue = deque()
+        self.event_callbacks = defaultdict(set)
+
+    def register_event(self, event, callback):
+        self.event_callbacks[event].add(callback)
+
+    def fire_event(self, event, *args, **kwargs):
+        self.event_queue.append((event, args))
+        self.process_events()
+
+    def process_events(self):
+        for event, args in iter_except(self.event_queue.popleft, IndexError):
+            for callback in self.event_callbacks[event]:
+                callback(*args)
+
+
+def make_handler():
+    def handler(report):
+        pass
+
+    return handler
+
+
+def setup(loop, handlers):
+    for i in range(handlers):
+        loop.register_event("device-report", make_handler())
+
+    # A handler that fires another event, like a binding switching
+    # profiles
+    loop.register_event("button", lambda report: loop.fire_event(
+        "device-report", report))
+
+
+def main():
+    handlers = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    report = object()
+
+    legacy = LegacyEvents()
+    setup(legacy, handlers)
+
+    loop = EventLoop()
+    setup(loop, handlers)
+
+    print("{0:<16} {1:>14} {2:>14} {3:>8} {4:>14}".format(
+        "event", "before (e/s)", "after (e/s)", "speedup", "after (ns/e)"))
+
+    for event in ("device-report", "button"):
+        before = rate(lambda: legacy.fire_event(event, report))
+        after = rate(lambda: loop.fire_event(event, report))
+        print("{0:<16} {1:>14,.0f} {2:>14,.0f} {3:>7.2f}x {4:>14.0f}".format(
+            event, before, after, after / before, 1e9 / after))
+
+
+if __name__ == "__main__":
+    main()
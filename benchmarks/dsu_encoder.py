@@ -0,0 +1,157 @@
+"""Measures how many DSU data packets are encoded per second on one core.
+
+    python -m benchmarks.dsu_encoder
+
+Compares the list based encoder that UDPServer used before with the
+preallocated DataPacket, with and without sensors, after checking that
+both encode the same bytes.
+"""
+
+import struct
+
+from unittest import mock
+
+from dsdrv.controllers import controllers
+from dsdrv.device import get_decoder
+from dsdrv.servers import udp
+
+from . import random_report, rate
+
+TIMESTAMP = 1234567890
+
+
+def legacy_encode(slot_info, counter, report, remap=False, send_touch=True):
+    """The packet building of UDPServer.report before DataPacket."""
+    data = [*slot_info, 0x01]
+
+    data.extend(bytes(struct.pack('<I', counter)))
+
+    buttons1 = 0x00
+    buttons1 |= report.button_share
+    buttons1 |= report.button_l3 << 1
+    buttons1 |= report.button_r3 << 2
+    buttons1 |= report.button_options << 3
+    buttons1 |= report.dpad_up << 4
+    buttons1 |= report.dpad_right << 5
+    buttons1 |= report.dpad_down << 6
+    buttons1 |= report.dpad_left << 7
+
+    buttons2 = 0x00
+    buttons2 |= report.button_l2
+    buttons2 |= report.button_r2 << 1
+    buttons2 |= report.button_l1 << 2
+    buttons2 |= report.button_r1 << 3
+    if not remap:
+        buttons2 |= report.button_triangle << 4
+        buttons2 |= report.button_circle << 5
+        buttons2 |= report.button_cross << 6
+        buttons2 |= report.button_square << 7
+    else:
+        buttons2 |= report.button_triangle << 7
+        buttons2 |= report.button_circle << 6
+        buttons2 |= report.button_cross << 5
+        buttons2 |= report.button_square << 4
+
+    data.extend([
+        buttons1, buttons2,
+        report.button_ps * 0xFF,
+        report.button_trackpad * 0xFF,
+
+        report.left_analog_x,
+        255 - report.left_analog_y,
+        report.right_analog_x,
+        255 - report.right_analog_y,
+
+        report.dpad_left * 0xFF,
+        report.dpad_down * 0xFF,
+        report.dpad_right * 0xFF,
+        report.dpad_up * 0xFF,
+
+        report.button_square * 0xFF,
+        report.button_cross * 0xFF,
+        report.button_circle * 0xFF,
+        report.button_triangle * 0xFF,
+
+        report.button_r1 * 0xFF,
+        report.button_l1 * 0xFF,
+
+        report.r2_analog,
+        report.l2_analog,
+    ])
+
+    if send_touch:
+        data.extend([
+            report.trackpad_touch0_active,
+            report.trackpad_touch0_id,
+
+            report.trackpad_touch0_x & 255,
+            report.trackpad_touch0_x >> 8,
+            report.trackpad_touch0_y & 255,
+            report.trackpad_touch0_y >> 8,
+
+            report.trackpad_touch1_active,
+            report.trackpad_touch1_id,
+
+            report.trackpad_touch1_x & 255,
+            report.trackpad_touch1_x >> 8,
+            report.trackpad_touch1_y & 255,
+            report.trackpad_touch1_y >> 8,
+        ])
+    else:
+        data.extend([
+            0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+            0x00, 0x00, 0x00, 0x00, 0x00, 0x00
+        ])
+
+    data.extend(bytes(struct.pack('<Q', TIMESTAMP)))
+
+    sensors = [
+        report.orientation_roll / 8192,
+        - report.orientation_yaw / 8192,
+        - report.orientation_pitch / 8192,
+        report.motion_y / 16,
+        - report.motion_x / 16,
+        - report.motion_z / 16,
+    ]
+
+    for sensor in sensors:
+        data.extend(bytes(struct.pack('<f', float(sensor))))
+
+    return bytes(udp.Message('data', data))
+
+
+def main():
+    slot_info = udp.SLOT_INFO.pack(0, 2, 2, 1, bytes(range(6)), 0xef)
+
+    print("{0:<12} {1:>14} {2:>14} {3:>8}".format(
+        "", "before (p/s)", "after (p/s)", "speedup"))
+
+    for name, sensors in (("sensors", True), ("no sensors", False)):
+        decoder = get_decoder(controllers.DualShock4, sensors=sensors)
+
+        with mock.patch.object(udp, "time", lambda: TIMESTAMP / 10**6):
+            for seed in range(256):
+                report = decoder.decode(random_report(64, seed))
+                for remap in (False, True):
+                    for send_touch in (False, True):
+                        packet = udp.DataPacket()
+                        packet.set_slot_info(slot_info, None, sensors)
+                        packet.counter = seed
+
+                        assert packet.fill(report, remap, send_touch) == \
+                            legacy_encode(slot_info, seed, report, remap,
+                                          send_touch)
+
+        report = decoder.decode(random_report(64))
+        packet = udp.DataPacket()
+        packet.set_slot_info(slot_info, None, sensors)
+
+        before = rate(lambda: legacy_encode(slot_info, 0, report))
+        after = rate(lambda: packet.fill(report))
+
+        print("{0:<12} {1:>14,.0f} {2:>14,.0f} {3:>7.2f}x".format(
+            name, before, after, after / before))
+
+
+if __name__ == "__main__":
+    main()
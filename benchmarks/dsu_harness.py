@@ -0,0 +1,325 @@
+"""Load and latency harness for the UDP (DSU) server.
+
+    python -m benchmarks.dsu_harness [--clients 1,16,64] [--controllers 1,4]
+                                     [--rates 250,1000] [--duration 3]
+
+Runs UDPServer in an event loop with synthetic controllers that fire a
+report every 1/rate seconds, for every combination of the given numbers
+of clients, controllers and report rates. Client processes speak the
+DSU protocol like Cemu does: a version and a ports request, then data
+requests for all slots (even clients) or for one slot (odd clients),
+repeated every second.
+
+Each report carries the time it was fired in its stick values, which
+gives the end-to-end latency of every packet a client receives. Server
+CPU is the time the loop thread spends decoding and dispatching reports
+to the server, per packet sent. One JSON object per combination is written to
+stdout, a summary table to stderr.
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+from array import array
+from binascii import crc32
+from types import SimpleNamespace
+
+from dsdrv.clock import DeviceClock
+from dsdrv.controllers import controllers
+from dsdrv.device import ReportPool, get_decoder
+from dsdrv.eventloop import EventLoop
+from dsdrv.servers import udp
+
+from . import random_report
+
+REPORT_SIZE = 64
+# Where the decoder reads the sticks of a DS4 USB report
+STICKS_OFFSET = 1
+# Where the sticks are in a DSU data packet
+PACKET_STICKS_OFFSET = udp.DATA_OFFSET + 8
+# Data requests are repeated this often, well within the client timeout
+KEEPALIVE = 1.0
+
+
+def request(message_type, data):
+    """Builds a client message."""
+    message = bytearray(udp.HEADER.pack(b'DSUC', 1001, len(data) + 4, 0,
+                                        0, 0x100000 | message_type))
+    message += bytes(data)
+    udp.CRC.pack_into(message, 8, crc32(message) & 0xffffffff)
+    return bytes(message)
+
+
+def version_request():
+    return request(0, [])
+
+
+def ports_request(slots):
+    return request(1, struct.pack('<i', len(slots)) + bytes(slots))
+
+
+def data_request(mode, slot=0):
+    return request(2, bytes([mode, slot]) + bytes(6))
+
+
+def microseconds(epoch):
+    return int((time.monotonic() - epoch) * 1e6) & 0xffffffff
+
+
+def run_clients(server_address, first, count, controller_count, epoch,
+                stop, results):
+    """Runs count clients in one process until stop is set."""
+    poll = select.epoll()
+    clients = {}
+    subscriptions = {}
+
+    for index in range(first, first + count):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        client.bind(("127.0.0.1", 0))
+        client.setblocking(False)
+
+        if index % 2 == 0:
+            subscriptions[client] = data_request(0)
+        else:
+            subscriptions[client] = data_request(1, index // 2 %
+                                                 controller_count)
+
+        client.sendto(version_request(), server_address)
+        client.sendto(ports_request(range(controller_count)), server_address)
+        client.sendto(subscriptions[client], server_address)
+
+        clients[client.fileno()] = client
+        poll.register(client.fileno(), select.EPOLLIN)
+
+    latencies = array('d')
+    received = versions = ports = 0
+    next_keepalive = time.monotonic() + KEEPALIVE
+
+    while not stop.is_set():
+        for fd, event in poll.poll(0.05):
+            client = clients[fd]
+            while True:
+                try:
+                    packet = client.recv(128)
+                except BlockingIOError:
+                    break
+
+                message_type = packet[16]
+                if message_type == 2:
+                    now = microseconds(epoch)
+                    lx, ly, rx, ry = packet[PACKET_STICKS_OFFSET:
+                                            PACKET_STICKS_OFFSET + 4]
+                    sent = lx | (255 - ly) << 8 | rx << 16 | (255 - ry) << 24
+                    latencies.append(((now - sent) & 0xffffffff) / 1e3)
+                    received += 1
+                elif message_type == 1:
+                    ports += 1
+                elif message_type == 0:
+                    versions += 1
+
+        if time.monotonic() >= next_keepalive:
+            for client, subscription in subscriptions.items():
+                client.sendto(subscription, server_address)
+            next_keepalive += KEEPALIVE
+
+    results.put(dict(received=received, versions=versions, ports=ports,
+                     latencies=latencies.tobytes()))
+
+
+class SyntheticController(object):
+    """A controller that fires reports carrying their send time."""
+
+    def __init__(self, loop, index):
+        self.index = index
+        self.loop = loop
+        self.options = SimpleNamespace(sensors=False)
+        self.clock = DeviceClock()
+        self.device = SimpleNamespace(
+            device_addr="AA:BB:CC:DD:EE:{0:02X}".format(index), type="usb",
+            sync_clock=lambda: self.clock)
+        self.decoder = get_decoder(controllers.DualShock4)
+        self.reports = ReportPool(buffer_size=REPORT_SIZE)
+        self.template = random_report(REPORT_SIZE, index)
+        self.fired = 0
+
+    def fire(self, epoch):
+        buf = self.reports.buffer()
+        buf[:] = self.template
+        struct.pack_into("<I", buf, STICKS_OFFSET, microseconds(epoch))
+
+        # Advance the report counter like a device does
+        counter = self.fired % 64
+        buf[self.decoder.trackpadps] = (buf[self.decoder.trackpadps] & 3 |
+                                        counter << 2)
+        self.clock.update(counter, time.monotonic())
+
+        report = self.decoder.decode_into(buf, self.reports.next())
+        self.loop.fire_event("device-report", report)
+        self.fired += 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(client_count, controller_count, rate, duration, processes):
+    epoch = time.monotonic()
+    loop = EventLoop()
+    server = udp.UDPServer("127.0.0.1", 0)
+    server.start(loop)
+
+    sources = []
+    for index in range(1, controller_count + 1):
+        controller = SyntheticController(loop.scope(), index)
+        server.register_controller(controller)
+        sources.append(controller)
+
+    state = SimpleNamespace(firing=False, cpu=0.0)
+
+    def fire():
+        if state.firing:
+            start = time.thread_time()
+            for controller in sources:
+                controller.fire(epoch)
+            state.cpu += time.thread_time() - start
+
+        return True
+
+    loop.create_timer(1.0 / rate, fire).start()
+    thread = threading.Thread(target=loop.run)
+    thread.start()
+
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = []
+    processes = min(processes, client_count)
+    for i in range(processes):
+        first = client_count * i // processes
+        count = client_count * (i + 1) // processes - first
+        worker = multiprocessing.Process(
+            target=run_clients,
+            args=(server.sock.getsockname(), first, count, controller_count,
+                  epoch, stop, results))
+        worker.start()
+        workers.append(worker)
+
+    deadline = time.monotonic() + 10
+    while len(server.clients) < client_count:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Clients failed to subscribe")
+        time.sleep(0.01)
+
+    # Packets each report of a slot is sent as
+    recipients = [len(server.clients.recipients(c.index - 1,
+                                                c.device.device_addr)[0])
+                  for c in sources]
+
+    start = time.monotonic()
+    state.firing = True
+    time.sleep(duration)
+    state.firing = False
+    elapsed = time.monotonic() - start
+
+    # Give the clients time to receive the last packets
+    time.sleep(0.5)
+    stop.set()
+
+    collected = [results.get() for worker in workers]
+    for worker in workers:
+        worker.join()
+
+    loop.stop()
+    thread.join()
+    server.sock.close()
+
+    latencies = array('d')
+    for result in collected:
+        latencies.frombytes(result["latencies"])
+    latencies = sorted(latencies)
+
+    sent = sum(c.fired * n for c, n in zip(sources, recipients))
+    received = sum(result["received"] for result in collected)
+
+    return dict(
+        clients=client_count,
+        controllers=controller_count,
+        rate=rate,
+        duration=round(elapsed, 3),
+        reports=sum(c.fired for c in sources),
+        packets_sent=sent,
+        packets_received=received,
+        loss=round(1 - received / sent, 6) if sent else 0,
+        version_responses=sum(result["versions"] for result in collected),
+        ports_responses=sum(result["ports"] for result in collected),
+        send_queue_dropped=server.dropped,
+        latency_ms=dict((name, percentile(latencies, fraction))
+                        for name, fraction in (("p50", 0.5), ("p90", 0.9),
+                                               ("p99", 0.99),
+                                               ("max", 1.0))),
+        server_cpu_us_per_packet=(round(state.cpu / sent * 1e6, 3)
+                                  if sent else None),
+        server_cpu_percent=round(state.cpu / elapsed * 100, 2),
+    )
+
+
+def numbers(value):
+    return [int(number) for number in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--clients", type=numbers, default=[1, 16, 64])
+    parser.add_argument("--controllers", type=numbers, default=[1, 4])
+    parser.add_argument("--rates", type=numbers, default=[250, 1000])
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--processes", type=int,
+                        default=max(1, min(4, (os.cpu_count() or 2) - 1)),
+                        help="Processes to run the clients in")
+    args = parser.parse_args()
+
+    # The server logs to stdout, keep it for the results
+    output = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        sweep(args, output)
+
+
+def sweep(args, output):
+    print("{0:>7} {1:>11} {2:>5} {3:>9} {4:>8} {5:>8} {6:>8} {7:>8} "
+          "{8:>11}".format("clients", "controllers", "rate", "packets",
+                           "loss %", "p50 ms", "p99 ms", "max ms",
+                           "cpu us/pkt"), file=sys.stderr)
+
+    for controller_count in args.controllers:
+        for client_count in args.clients:
+            for rate in args.rates:
+                result = run(client_count, controller_count, rate,
+                             args.duration, args.processes)
+                print(json.dumps(result, sort_keys=True), file=output)
+                output.flush()
+
+                latency = result["latency_ms"]
+                print("{0:>7} {1:>11} {2:>5} {3:>9} {4:>8.2f} {5:>8.3f} "
+                      "{6:>8.3f} {7:>8.3f} {8:>11.2f}".format(
+                          client_count, controller_count, rate,
+                          result["packets_sent"], result["loss"] * 100,
+                          latency["p50"] or 0, latency["p99"] or 0,
+                          latency["max"] or 0,
+                          result["server_cpu_us_per_packet"] or 0),
+                      file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Load test of the UDP server with a swarm of local DSU clients.
+
+    python -m benchmarks.dsu_swarm [clients] [reports]
+
+The clients (default 64) subscribe to all slots, to slot 0, to slot 1 or
+to the MAC of slot 0 in turn. Reports for slot 0 are then fanned out to
+the subscribed clients, once with a sendto() per client and once batched
+with sendmmsg. Clients are drained between bursts of reports, so that
+every packet sent should also be received.
+"""
+
+import select
+import socket
+import sys
+import time
+
+from types import SimpleNamespace
+
+from dsdrv.clock import DeviceClock
+from dsdrv.controllers import controllers
+from dsdrv.device import get_decoder
+from dsdrv.eventloop import EventLoop
+from dsdrv.packages import sendmmsg
+from dsdrv.servers import udp
+
+from . import random_report
+
+MAC = bytes([0xaa, 0xbb, 0xcc, 0xdd, 0xee, 0x01])
+BURST = 32
+
+
+def data_request(mode, slot=0, mac=bytes(6)):
+    request = bytearray(28)
+    request[16:20] = udp.Message.Types['data']
+    request[20] = mode
+    request[21] = slot
+    request[22:28] = mac
+    return bytes(request)
+
+
+def create_swarm(count, server_address):
+    clients = []
+    subscriptions = (data_request(0), data_request(1, 0), data_request(1, 1),
+                     data_request(2, mac=MAC))
+
+    for i in range(count):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        client.bind(("127.0.0.1", 0))
+        client.setblocking(False)
+        client.sendto(subscriptions[i % len(subscriptions)], server_address)
+        clients.append(client)
+
+    return clients
+
+
+def drain(clients):
+    received = 0
+    for client in clients:
+        while True:
+            try:
+                client.recv(128)
+                received += 1
+            except BlockingIOError:
+                break
+
+    return received
+
+
+def run(server, controller, clients, report, reports):
+    elapsed = received = 0
+
+    for burst in range(reports // BURST):
+        start = time.perf_counter()
+        for i in range(BURST):
+            server.report(0, controller, report)
+        elapsed += time.perf_counter() - start
+
+        received += drain(clients)
+
+    addresses, batch = server.clients.recipients(
+        0, controller.device.device_addr)
+    reports = reports // BURST * BURST
+
+    return reports, elapsed, len(addresses) * reports, received
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    reports = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    loop = EventLoop()
+    server = udp.UDPServer("127.0.0.1", 0)
+    server.start(loop)
+
+    controller = SimpleNamespace(
+        index=1, loop=loop, options=SimpleNamespace(sensors=False),
+        device=SimpleNamespace(device_addr=":".join("%02X" % b for b in MAC),
+                               type="usb", sync_clock=DeviceClock))
+    server.register_controller(controller)
+
+    clients = create_swarm(count, server.sock.getsockname())
+
+    # Let the server handle the data requests
+    while len(server.clients) < count:
+        select.select([server.sock], [], [], 1.0)
+        server._read_requests()
+
+    report = get_decoder(controllers.DualShock4).decode(random_report(64))
+
+    print("{0:<10} {1:>8} {2:>12} {3:>14} {4:>10} {5:>8}".format(
+        "send", "clients", "reports/s", "packets/s", "us/report",
+        "loss %"))
+
+    modes = [("sendto", False)]
+    if sendmmsg.available:
+        modes.append(("sendmmsg", True))
+
+    for name, available in modes:
+        sendmmsg.available = available
+        server.clients._build_index()
+
+        sent_reports, elapsed, sent, received = run(server, controller,
+                                                    clients, report, reports)
+        print("{0:<10} {1:>8} {2:>12,.0f} {3:>14,.0f} {4:>10.1f} {5:>8.2f}"
+              .format(name, sent // sent_reports, sent_reports / elapsed,
+                      sent / elapsed, elapsed / sent_reports * 1e6,
+                      100.0 * (sent - received) / sent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Counts the mouse timer wakeups of a controller, idle and in use.
+
+    python -m benchmarks.mouse_timer [seconds] [rate]
+
+Runs ReportActionInput with --trackpad-mouse on reports fed through a
+socket pair at the given report rate (default 250/s), once with the
+trackpad untouched and the sticks centered and once with a finger on
+the trackpad. Before is the fixed 5 ms timer that ran for as long as a
+device was connected, after is the timer that only runs while there is
+mouse motion. The uinput devices write to /dev/null.
+"""
+
+import os
+import socket
+import sys
+import time
+
+from argparse import Namespace
+from threading import Thread
+from types import SimpleNamespace
+from unittest import mock
+
+from dsdrv import uinput
+from dsdrv.actions.input import ReportActionInput
+from dsdrv.controllers import controllers
+from dsdrv.device import ReportPool, get_decoder
+from dsdrv.eventloop import EventLoop
+
+from . import random_report
+
+REPORT_SIZE = 64
+DS4 = controllers.DualShock4.value
+
+
+class NullUInput(object):
+    def __init__(self, *args, **kwargs):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+        self.device = None
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LegacyInput(ReportActionInput):
+    """Emits the mouse every 5 ms while a device is connected."""
+
+    def setup(self, device):
+        self.legacy_timer = self.create_timer(0.005, self.emit_mouse)
+        self.legacy_timer.start()
+
+    def emit_mouse(self, report):
+        super(LegacyInput, self).emit_mouse(report)
+        return True
+
+    def handle_report(self, report):
+        if self.joystick:
+            self.joystick.emit(report)
+
+        if self.mouse:
+            self.mouse.emit(report)
+
+
+def create_report(touching, seed):
+    buf = random_report(REPORT_SIZE, seed)
+    for position in (DS4.lstick_start, DS4.lstick_start + 1,
+                     DS4.rstick_start, DS4.rstick_start + 1):
+        buf[position] = 128
+
+    # The touch is active while the top bit of its first byte is clear
+    for touch in (DS4.touchpad_start, DS4.touchpad_start + 4):
+        if touching and touch == DS4.touchpad_start:
+            buf[touch] &= 0x7f
+        else:
+            buf[touch] |= 0x80
+
+    return buf
+
+
+def run(action_class, touching, duration, rate):
+    loop = EventLoop()
+    controller = SimpleNamespace(
+        loop=loop, logger=mock.Mock(), profiles=[], profile_options={},
+        device=object(), dynamic=False,
+        default_profile=Namespace(profile_toggle=None))
+    options = Namespace(mapping=None, emulate_xboxdrv=False,
+                        emulate_xpad=False, emulate_xpad_wireless=False,
+                        trackpad_mouse=True, sensors=False,
+                        ignored_buttons=[], mouse_rate=200)
+
+    with mock.patch.object(uinput, "UInput", NullUInput):
+        action = action_class(controller)
+        loop.fire_event("load-options", options)
+
+    emits = [0]
+    emit_mouse = action.mouse.emit_mouse
+
+    def counted(report):
+        emits[0] += 1
+        emit_mouse(report)
+
+    action.mouse.emit_mouse = counted
+
+    decoder = get_decoder(controllers.DualShock4)
+    pool = ReportPool(buffer_size=REPORT_SIZE)
+    sock, peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    sock.setblocking(False)
+
+    def read_report():
+        buf = pool.buffer()
+        sock.recv_into(buf)
+        loop.fire_event("device-report",
+                        decoder.decode_into(buf, pool.next()))
+
+    loop.add_watcher(sock, read_report)
+    loop.fire_event("device-setup", None)
+
+    thread = Thread(target=loop.run)
+    thread.start()
+
+    # Move the finger a little with every report
+    reports = [create_report(touching, i) for i in range(16)]
+    deadline = time.monotonic() + duration
+    next_report, sent = time.monotonic(), 0
+    expirations = loop.timer_expirations
+    while next_report < deadline:
+        peer.send(reports[sent % len(reports)])
+        sent += 1
+        next_report += 1.0 / rate
+        time.sleep(max(next_report - time.monotonic(), 0))
+
+    wakeups = loop.timer_expirations - expirations
+    loop.stop()
+    thread.join()
+
+    return wakeups / duration, emits[0] / duration
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 250
+
+    print("{0:<10} {1:<7} {2:>12} {3:>12}".format(
+        "trackpad", "timer", "wakeups/s", "emits/s"))
+
+    for touching in (False, True):
+        for name, action_class in (("before", LegacyInput),
+                                   ("after", ReportActionInput)):
+            wakeups, emits = run(action_class, touching, duration, rate)
+            print("{0:<10} {1:<7} {2:>12.1f} {3:>12.1f}".format(
+                "touched" if touching else "idle", name, wakeups, emits))
+
+
+if __name__ == "__main__":
+    main()
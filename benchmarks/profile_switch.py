@@ -0,0 +1,122 @@
+"""Measures how long ReportActionInput takes to switch profiles.
+
+    python -m benchmarks.profile_switch [switches]
+
+Switches back and forth between a ds4 profile and an xpad profile with
+the trackpad mouse. Before is the load_options that closed the joystick
+and created a new one on every switch, after picks the device from the
+pool created when the device was connected. Real uinput devices
+are used when /dev/uinput can be opened, otherwise the devices write to
+/dev/null and the times leave out the kernel's part of creating one.
+"""
+
+import os
+import sys
+import time
+
+from argparse import Namespace
+from types import SimpleNamespace
+from unittest import mock
+
+from evdev import UInput
+
+from dsdrv import uinput
+from dsdrv.actions.input import ReportActionInput, joystick_layout
+from dsdrv.eventloop import EventLoop
+
+
+class NullUInput(object):
+    def __init__(self, *args, **kwargs):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+        self.device = None
+
+    def close(self):
+        os.close(self.fd)
+
+
+class LegacyInput(ReportActionInput):
+    """Creates a new joystick whenever the layout changes."""
+
+    def load_options(self, options):
+        layout = joystick_layout(options)
+
+        if not self.mouse and options.trackpad_mouse:
+            self.mouse = uinput.create_uinput_device("mouse")
+        elif self.mouse and not options.trackpad_mouse:
+            self.mouse.device.close()
+            self.mouse = None
+
+        if self.joystick and self.joystick_layout != layout:
+            self.joystick.device.close()
+            self.joystick = uinput.create_uinput_device(layout)
+        elif not self.joystick:
+            self.joystick = uinput.create_uinput_device(layout)
+
+        self.joystick_layout = layout
+        self.joystick.set_ignored_buttons(options.ignored_buttons)
+
+
+def profile(**kwargs):
+    options = dict(mapping=None, emulate_xboxdrv=False, emulate_xpad=False,
+                   emulate_xpad_wireless=False, trackpad_mouse=False,
+                   sensors=False, ignored_buttons=[], mouse_rate=200)
+    options.update(kwargs)
+    return Namespace(**options)
+
+
+def run(action_class, switches):
+    profiles = {"default": profile(),
+                "xpad": profile(emulate_xpad=True, trackpad_mouse=True)}
+    controller = SimpleNamespace(
+        loop=EventLoop(), logger=mock.Mock(), profiles=["xpad", "default"],
+        profile_options=profiles, device=object(), dynamic=False,
+        default_profile=Namespace(profile_toggle=None))
+
+    action = action_class(controller)
+    controller.loop.fire_event("load-options", profiles["default"])
+
+    times = []
+    for i in range(switches):
+        options = profiles["xpad" if i % 2 == 0 else "default"]
+        start = time.perf_counter()
+        controller.loop.fire_event("load-options", options)
+        times.append(time.perf_counter() - start)
+
+    for device in set([action.joystick, action.mouse] +
+                      list(getattr(action, "devices", {}).values())):
+        if device:
+            device.device.close()
+
+    return times
+
+
+def uinput_available():
+    try:
+        os.close(os.open("/dev/uinput", os.O_WRONLY))
+        return True
+    except OSError:
+        return False
+
+
+def main():
+    switches = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fake = None if uinput_available() else NullUInput
+
+    if fake:
+        print("/dev/uinput is not available, writing to /dev/null")
+
+    print("{0:<7} {1:>12} {2:>12} {3:>12}".format(
+        "switch", "mean (us)", "median (us)", "max (us)"))
+
+    for name, action_class in (("before", LegacyInput),
+                               ("after", ReportActionInput)):
+        with mock.patch.object(uinput, "UInput", fake or UInput):
+            times = sorted(run(action_class, switches))
+
+        print("{0:<7} {1:>12.1f} {2:>12.1f} {3:>12.1f}".format(
+            name, sum(times) / len(times) * 1e6,
+            times[len(times) // 2] * 1e6, times[-1] * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Compares a thread per controller with a single shared reactor.
+
+    python -m benchmarks.reactor [controllers] [rate] [seconds]
+
+Simulated controllers are socket pairs fed by a writer thread at the
+given report rate (default 8 controllers at 1000 reports/s for 3 s).
+Every report is decoded and fired as a device-report event to a few
+handlers, like the actions of a real controller. The CPU time includes
+the writer thread, which does the same work in both modes.
+"""
+
+import resource
+import socket
+import struct
+import sys
+import time
+
+from threading import Thread
+
+from dsdrv.controllers import controllers
+from dsdrv.device import ReportPool, get_decoder
+from dsdrv.eventloop import EventLoop
+
+from . import random_report
+
+REPORT_SIZE = 64
+HANDLERS = 7
+
+# Send time of the report, written to bytes the decoder doesn't read
+SEND_TIME = struct.Struct("<d")
+SEND_TIME_OFFSET = 48
+
+
+class SimulatedController(object):
+    def __init__(self, loop):
+        self.loop = loop
+        self.sock, self.peer = socket.socketpair(socket.AF_UNIX,
+                                                 socket.SOCK_SEQPACKET)
+        self.sock.setblocking(False)
+
+        self.decoder = get_decoder(controllers.DualShock4)
+        self.reports = ReportPool(buffer_size=REPORT_SIZE)
+        self.latencies = []
+
+        for i in range(HANDLERS - 1):
+            loop.register_event("device-report", self.handle_report)
+        loop.register_event("device-report", self.measure_latency)
+        loop.add_watcher(self.sock, self.read_report)
+
+    def read_report(self):
+        buf = self.reports.buffer()
+        try:
+            self.sock.recv_into(buf)
+        except IOError:
+            return
+
+        report = self.decoder.decode_into(buf, self.reports.next())
+        self.loop.fire_event("device-report", report)
+
+    def handle_report(self, report):
+        report.left_analog_x, report.button_cross
+
+    def measure_latency(self, report):
+        sent, = SEND_TIME.unpack_from(report.raw, SEND_TIME_OFFSET)
+        self.latencies.append(time.perf_counter() - sent)
+
+    def close(self):
+        self.loop.stop()
+        self.sock.close()
+        self.peer.close()
+
+
+def write_reports(controllers, rate, duration):
+    buf = random_report(REPORT_SIZE)
+    interval = 1.0 / rate
+    deadline = time.perf_counter() + duration
+    next_send = time.perf_counter()
+
+    while next_send < deadline:
+        for controller in controllers:
+            SEND_TIME.pack_into(buf, SEND_TIME_OFFSET, time.perf_counter())
+            controller.peer.send(buf)
+
+        next_send += interval
+        delay = next_send - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run(mode, count, rate, duration):
+    threads = []
+
+    if mode == "threaded":
+        loops = [EventLoop() for i in range(count)]
+        threads = [Thread(target=loop.run) for loop in loops]
+    else:
+        reactor = EventLoop()
+        loops = [reactor.scope() for i in range(count)]
+        threads = [Thread(target=reactor.run)]
+
+    simulated = [SimulatedController(loop) for loop in loops]
+    for thread in threads:
+        thread.start()
+
+    start = resource.getrusage(resource.RUSAGE_SELF)
+    start_time = time.perf_counter()
+    write_reports(simulated, rate, duration)
+    time.sleep(0.1)
+    elapsed = time.perf_counter() - start_time
+    end = resource.getrusage(resource.RUSAGE_SELF)
+
+    for controller in simulated:
+        controller.close()
+    if mode == "threaded":
+        for loop in loops:
+            loop.stop()
+    else:
+        reactor.stop()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(l for c in simulated for l in c.latencies)
+    cpu = (end.ru_utime + end.ru_stime) - (start.ru_utime + start.ru_stime)
+    switches = (end.ru_nvcsw + end.ru_nivcsw) - (start.ru_nvcsw + start.ru_nivcsw)
+
+    return dict(mode=mode, reports=len(latencies),
+                cpu=100 * cpu / elapsed,
+                switches=switches / elapsed,
+                mean=1e6 * sum(latencies) / max(len(latencies), 1),
+                p50=1e6 * latencies[len(latencies) // 2] if latencies else 0,
+                p99=1e6 * latencies[int(len(latencies) * 0.99)] if latencies else 0)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    rate = float(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 3.0
+
+    print("{0} controllers at {1:.0f} reports/s".format(count, rate))
+    print("{0:<10} {1:>9} {2:>7} {3:>12} {4:>10} {5:>10} {6:>10}".format(
+        "mode", "reports", "cpu %", "switches/s", "mean (us)", "p50 (us)",
+        "p99 (us)"))
+
+    for mode in ("threaded", "reactor"):
+        result = run(mode, count, rate, duration)
+        print("{mode:<10} {reports:>9} {cpu:>7.1f} {switches:>12,.0f} "
+              "{mean:>10.1f} {p50:>10.1f} {p99:>10.1f}".format(**result))
+
+
+if __name__ == "__main__":
+    main()
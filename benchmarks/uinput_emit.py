@@ -0,0 +1,248 @@
+"""Measures how many reports UInputDevice.emit() handles per second.
+
+    python -m benchmarks.uinput_emit [seconds]
+
+Compares the emit that walked the layout dicts on every report with the
+compiled EmitPlan that writes each frame at once, for the ds4, xpad and
+a custom keyboard mapping. The uinput device is replaced by /dev/null,
+after checking that both write the same events for every report. The
+writes columns are the write(2) calls per report before and after.
+"""
+
+import os
+import sys
+
+from unittest import mock
+
+from dsdrv import uinput
+from dsdrv.controllers import controllers
+from dsdrv.device import get_decoder
+
+from . import random_report, rate
+
+# The keyboard mapping of the example dsdrv.conf
+KEYBOARD = {
+    "KEY_UP": "dpad_up", "KEY_LEFT": "dpad_left",
+    "KEY_DOWN": "dpad_down", "KEY_RIGHT": "dpad_right",
+    "KEY_Z": "button_cross", "KEY_X": "button_circle",
+    "KEY_W": "-left_analog_y", "KEY_A": "-left_analog_x",
+    "KEY_S": "+left_analog_y", "KEY_D": "+left_analog_x",
+    "REL_X": "right_analog_x", "REL_Y": "right_analog_y",
+    "BTN_LEFT": "button_r2", "BTN_RIGHT": "button_l2",
+    "REL_WHEELUP": "button_l1", "REL_WHEELDOWN": "button_r1",
+}
+
+# Reports in the stream, the sticks move in all of them and the buttons
+# change every BUTTON_INTERVAL reports
+REPORTS = 256
+BUTTON_INTERVAL = 16
+
+
+class FakeUInput(object):
+    """Records the events written, one at a time or in frames."""
+
+    def __init__(self, *args, **kwargs):
+        self.events = []
+        self.pipe, self.fd = os.pipe()
+
+    def write(self, etype, code, value):
+        self.events.append((etype, code, int(value)))
+
+    def syn(self):
+        self.events.append(None)
+
+    def read_frames(self):
+        """Moves the frames written to the fd to events."""
+        os.set_blocking(self.pipe, False)
+        try:
+            data = os.read(self.pipe, 1 << 16)
+        except BlockingIOError:
+            return
+
+        for sec, usec, etype, code, value in \
+                uinput.INPUT_EVENT.iter_unpack(data):
+            if etype == uinput.ecodes.EV_SYN:
+                self.events.append(None)
+            else:
+                self.events.append((etype, code, value))
+
+
+class NullUInput(object):
+    """Writes to /dev/null, one write(2) per event like evdev does."""
+
+    def __init__(self, *args, **kwargs):
+        self.fd = os.open(os.devnull, os.O_WRONLY)
+        self.writes = 0
+
+    def write(self, etype, code, value):
+        os.write(self.fd, uinput.INPUT_EVENT.pack(0, 0, etype, code, value))
+        self.writes += 1
+
+    def syn(self):
+        self.write(uinput.ecodes.EV_SYN, uinput.ecodes.SYN_REPORT, 0)
+
+
+def counting_writes(func):
+    """Wraps os.write to count the calls while func runs."""
+    calls = [0]
+    write = os.write
+
+    def counted(fd, data):
+        calls[0] += 1
+        return write(fd, data)
+
+    with mock.patch.object(os, "write", counted):
+        func()
+
+    return calls[0]
+
+
+def legacy_emit(device, report, cache):
+    """UInputDevice.emit before EmitPlan, with its write cache."""
+    ecodes = uinput.ecodes
+
+    def write_event(etype, code, value):
+        last_value = cache.get(code)
+        if last_value != value:
+            device.device.write(etype, code, value)
+            cache[code] = value
+
+    for name, attr in device.layout.axes.items():
+        value = getattr(report, attr)
+        write_event(ecodes.EV_ABS, name, value)
+
+    for name, attr in device.layout.buttons.items():
+        attr, modifier = attr
+
+        if attr in device.ignored_buttons:
+            value = False
+        else:
+            value = getattr(report, attr)
+
+        if modifier and "analog" in attr:
+            if modifier == "+":
+                value = value > (128 + uinput.DEFAULT_A2D_DEADZONE)
+            elif modifier == "-":
+                value = value < (128 - uinput.DEFAULT_A2D_DEADZONE)
+
+        write_event(ecodes.EV_KEY, name, value)
+
+    for name, attr in device.layout.hats.items():
+        if getattr(report, attr[0]):
+            value = -1
+        elif getattr(report, attr[1]):
+            value = 1
+        else:
+            value = 0
+
+        write_event(ecodes.EV_ABS, name, value)
+
+    device.device.syn()
+
+
+def frames(events):
+    """Returns the events between the syn()s, without the empty frames.
+
+    The order of the events of a frame doesn't matter."""
+    frames, frame = [], []
+    for event in events:
+        if event:
+            frame.append(event)
+        elif frame:
+            frames.append(sorted(frame))
+            frame = []
+
+    return frames
+
+
+def report_stream():
+    decoder = get_decoder(controllers.DualShock4)
+    base = random_report(64)
+    reports = []
+
+    for i in range(REPORTS):
+        buf = bytearray(base)
+        if i // BUTTON_INTERVAL % 2:
+            buf[5] ^= 0xf0
+            buf[6] ^= 0x33
+
+        for offset in range(1, 5):
+            buf[offset] = (buf[offset] + i * offset * 7) % 256
+
+        reports.append(decoder.decode(buf))
+
+    return reports
+
+
+def create_device(mapping, fake):
+    with mock.patch.object(uinput, "UInput", fake):
+        device = uinput.create_uinput_device(mapping)
+
+    device.set_ignored_buttons({"button_ps"})
+    return device
+
+
+def reset_cache(device):
+    """The write cache of legacy_emit after emit_reset()."""
+    return dict((code, value) for (etype, code), value in
+                zip(device.plan.events, device.plan.reset_values))
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    reports = report_stream()
+
+    uinput.parse_uinput_mapping("keyboard", KEYBOARD)
+
+    print("{0:<10} {1:>8} {2:>14} {3:>14} {4:>8} {5:>8} {6:>8}".format(
+        "mapping", "events", "before (r/s)", "after (r/s)", "speedup",
+        "writes", "writes"))
+
+    for mapping in ("ds4", "xpad", "keyboard"):
+        # Both implementations have to write the same events
+        legacy, compiled = (create_device(mapping, FakeUInput)
+                            for i in range(2))
+        compiled.device.read_frames()
+        legacy.device.events, compiled.device.events = [], []
+        cache = reset_cache(compiled)
+        for report in reports:
+            legacy_emit(legacy, report, cache)
+            compiled.emit(report)
+            compiled.device.read_frames()
+
+        assert (frames(legacy.device.events) ==
+                frames(compiled.device.events)), mapping
+
+        legacy, compiled = (create_device(mapping, NullUInput)
+                            for i in range(2))
+        cache = reset_cache(compiled)
+        stream = iter(())
+
+        def next_report():
+            nonlocal stream
+            try:
+                return next(stream)
+            except StopIteration:
+                stream = iter(reports)
+                return next(stream)
+
+        before = rate(lambda: legacy_emit(legacy, next_report(), cache),
+                      duration)
+        after = rate(lambda: compiled.emit(next_report()), duration)
+
+        # Syscalls per report over the whole stream
+        cache = reset_cache(compiled)
+        writes_before = counting_writes(
+            lambda: [legacy_emit(legacy, r, cache) for r in reports])
+        writes_after = counting_writes(
+            lambda: [compiled.emit(r) for r in reports])
+
+        print("{0:<10} {1:>8} {2:>14,.0f} {3:>14,.0f} {4:>7.2f}x "
+              "{5:>8.2f} {6:>8.2f}".format(
+                  mapping, len(compiled.plan.events), before, after,
+                  after / before, writes_before / len(reports),
+                  writes_after / len(reports)))
+
+
+if __name__ == "__main__":
+    main()
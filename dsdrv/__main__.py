@@ -6,22 +6,25 @@ import evdev
 
 from .actions import ActionRegistry
 from .backends import BluetoothBackend, HidrawBackend
-from .servers import UDPServer
+from .servers import UDPServer, UnixServer
 from .config import load_options
 from .daemon import Daemon
 from .eventloop import EventLoop
 from .exceptions import BackendError
+from .executor import ActionExecutor
 
 
 class DSController(object):
-    def __init__(self, index, options, dynamic=False):
+    def __init__(self, index, options, dynamic=False, loop=None,
+                 executor=None):
         self.index = index
         self.dynamic = dynamic
         self.logger = Daemon.logger.new_module("controller {0}".format(index))
 
         self.error = None
         self.device = None
-        self.loop = EventLoop()
+        self.loop = loop or EventLoop()
+        self.executor = executor or ActionExecutor()
 
         self.actions = [cls(self) for cls in ActionRegistry.actions]
         self.bindings = options.parent.bindings
@@ -84,6 +87,22 @@ class DSController(object):
 
     def cleanup_device(self):
         self.logger.info("Disconnected")
+
+        report_filter = self.device.report_filter
+        if report_filter:
+            self.logger.info("Skipped {0} unchanged reports, processed {1}",
+                             report_filter.skipped, report_filter.delivered)
+
+        clock = self.device.clock
+        if clock and clock.period:
+            self.logger.info("Report interval {0:.3f} ms, drift {1:+.0f} ppm, "
+                             "jitter {2:.0f} us", clock.period * 1000,
+                             clock.drift_ppm, clock.jitter * 1e6)
+
+        if self.device.coalesced_reports:
+            self.logger.info("Coalesced {0} reports",
+                             self.device.coalesced_reports)
+
         self.fire_event("device-cleanup")
         self.loop.remove_watcher(self.device.report_fd)
         self.device.close()
@@ -93,20 +112,26 @@ class DSController(object):
             self.loop.stop()
 
     def load_options(self, options):
+        if self.device:
+            self.device.set_sensors(options.sensors)
+
+        self.latest_report_only = options.report_policy == "latest"
         self.fire_event("load-options", options)
         self.options = options
 
     def read_report(self):
-        report = self.device.read_report()
-
-        if not report:
-            if report is False:
+        device = self.device
+        for report in device.read_reports(self.latest_report_only):
+            if report is None:
+                self.cleanup_device()
                 return
 
-            self.cleanup_device()
-            return
+            self.fire_event("device-report", report)
 
-        self.fire_event("device-report", report)
+            # A handler may have disconnected the device, e.g. by exiting
+            # the controller
+            if self.device is not device:
+                return
 
     def run(self):
         self.loop.run()
@@ -124,8 +149,42 @@ class DSController(object):
             self.logger.info(*args)
 
 
-def create_controller_thread(index, controller_options, dynamic=False):
-    controller = DSController(index, controller_options, dynamic=dynamic)
+class Reactor(object):
+    """A single event loop thread shared by all controllers."""
+
+    def __init__(self):
+        self.loop = EventLoop()
+        self.thread = Thread(target=self.loop.run)
+        self.thread.start()
+
+    def stop(self):
+        self.loop.stop()
+        self.thread.join()
+
+
+class ReactorController(object):
+    """Stands in for a controller thread when using a Reactor."""
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def is_alive(self):
+        return self.controller.loop.running
+
+    def join(self):
+        pass
+
+
+def create_controller_thread(index, controller_options, dynamic=False,
+                             reactor=None, executor=None):
+    if reactor:
+        controller = DSController(index, controller_options, dynamic=dynamic,
+                                  loop=reactor.loop.scope(),
+                                  executor=executor)
+        return ReactorController(controller)
+
+    controller = DSController(index, controller_options, dynamic=dynamic,
+                              executor=executor)
 
     thread = Thread(target=controller.run)
     thread.controller = controller
@@ -137,6 +196,7 @@ def create_controller_thread(index, controller_options, dynamic=False):
 class SigintHandler(object):
     def __init__(self, threads):
         self.threads = threads
+        self.reactor = None
 
     def cleanup_controller_threads(self):
         for thread in self.threads:
@@ -144,6 +204,9 @@ class SigintHandler(object):
             thread.controller.loop.stop()
             thread.join()
 
+        if self.reactor:
+            self.reactor.stop()
+
     def __call__(self, signum, frame):
         signal.signal(signum, signal.SIG_DFL)
 
@@ -167,6 +230,9 @@ def main():
     else:
         backend = HidrawBackend(Daemon.logger)
 
+    backend.skip_unchanged_reports = options.skip_unchanged_reports
+    backend.report_heartbeat = options.report_heartbeat
+
     try:
         backend.setup()
     except BackendError as err:
@@ -175,21 +241,57 @@ def main():
     if options.daemon:
         Daemon.fork(options.daemon_log, options.daemon_pid)
 
+    reactor = None
+    if options.single_reactor:
+        reactor = sigint_handler.reactor = Reactor()
+
+    # Runs the exec binding actions of all controllers
+    executor = ActionExecutor(options.action_workers)
+
     udpserver = None
 
     if options.udp:
         udpserver = UDPServer(options.udp_host, options.udp_port)
         udpserver.remap = options.udp_remap_buttons
         udpserver.send_touch = not options.udp_no_touch
-        udpserver.start()
+        udpserver.rate = options.udp_rate
+        udpserver.client_rate = options.udp_client_rate
+        udpserver.idle_rate = options.udp_idle_rate
+        # Handled by the same loop as the reports when it is shared
+        udpserver.start(reactor.loop if reactor else None)
+
+    unixserver = None
+
+    if options.unix:
+        try:
+            unixserver = UnixServer(options.unix_path)
+        except OSError as err:
+            Daemon.exit("Failed to create the Unix socket: {0}", err)
+
+        unixserver.queue_size = options.unix_queue_size
+        unixserver.start(reactor.loop if reactor else None)
 
     for index, controller_options in enumerate(options.controllers):
-        thread = create_controller_thread(index + 1, controller_options)
+        thread = create_controller_thread(index + 1, controller_options,
+                                          reactor=reactor, executor=executor)
         threads.append(thread)
 
         if options.udp:
             udpserver.register_controller(thread.controller)
 
+        if options.unix:
+            unixserver.register_controller(thread.controller)
+
+    try:
+        connect_devices(backend, threads, options, reactor, executor)
+    finally:
+        # Also on SIGINT, which exits from the signal handler
+        if unixserver:
+            unixserver.close()
+
+
+def connect_devices(backend, threads, options, reactor, executor):
+    """Sets up a controller for every device the backend finds."""
     for device in backend.devices:
         connected_devices = []
         for thread in threads:
@@ -214,9 +316,11 @@ def main():
         else:
             thread = create_controller_thread(len(threads) + 1,
                                               options.default_controller,
-                                              dynamic=True)
+                                              dynamic=True, reactor=reactor,
+                                              executor=executor)
             threads.append(thread)
         thread.controller.setup_device(device)
 
+
 if __name__ == "__main__":
     main()
@@ -60,6 +60,12 @@ class ReportAction(Action):
         self.register_event("device-report", self._handle_report)
 
     def create_timer(self, interval, callback):
+        """Creates a timer that is called with the latest report.
+
+        The report is only valid during the callback, retain or
+        snapshot it to keep it.
+        """
+
         @wraps(callback)
         def wrapper(*args, **kwargs):
             if self._last_report:
@@ -69,6 +75,8 @@ class ReportAction(Action):
         return super(ReportAction, self).create_timer(interval, wrapper)
 
     def _handle_report(self, report):
+        # No need to retain it, the device's report pool never recycles
+        # the latest report.
         self._last_report = report
         self.handle_report(report)
 
@@ -6,4 +6,5 @@ from . import btsignal
 from . import dump
 from . import input
 from . import led
+from . import shm
 from . import status
@@ -1,13 +1,14 @@
-import os
 import re
 import shlex
 import subprocess
 
 from collections import namedtuple
+from inspect import signature
 from itertools import chain
 
 from ..action import ReportAction
 from ..config import buttoncombo
+from ..device import BUTTON_FIELDS, DSReport
 
 ReportAction.add_option("--bindings", metavar="bindings",
                         help="Use custom action bindings specified in the "
@@ -18,7 +19,115 @@ ReportAction.add_option("--profile-toggle", metavar="button(s)",
                         help="A button combo that will trigger profile "
                              "cycling, e.g. 'R1+L1+PS'")
 
-ActionBinding = namedtuple("ActionBinding", "modifiers button callback args")
+ReportAction.add_option("--action-timeout", metavar="seconds", type=float,
+                        default=0,
+                        help="Kill commands run by exec bindings that take "
+                             "longer than this. Default is 0, no limit")
+
+ReportAction.add_option("--action-queue-size", metavar="actions", type=int,
+                        default=16,
+                        help="Exec binding actions queued while an earlier "
+                             "one still runs before new ones are dropped. "
+                             "Default is 16")
+
+ActionBinding = namedtuple("ActionBinding",
+                           "modifier_mask button_mask callback args")
+
+# An action parsed when the options are loaded. args are strings, or
+# ArgTemplates for the arguments that contain variables.
+ActionTemplate = namedtuple("ActionTemplate", "type func args variables")
+
+# A format string and the (variable, attribute) pairs of its fields
+ArgTemplate = namedtuple("ArgTemplate", "format variables")
+
+VARIABLE = re.compile(r"\$(?P<var>\w+)(\.(?P<attr>\w+))?")
+VARIABLES = ("name", "profile", "device_addr", "report")
+
+# The values of a report that $report.<attr> can refer to, without the
+# bookkeeping of ReportState and the methods
+REPORT_FIELDS = frozenset(DSReport.__slots__)
+
+
+def parse_arg(arg):
+    """Returns arg, or its ArgTemplate if it contains variables."""
+    variables = []
+
+    def replace_var(match):
+        var, attr = match.group("var", "attr")
+        if var not in VARIABLES:
+            raise ValueError("Unknown variable: ${0}".format(var))
+
+        if attr and (var != "report" or attr not in REPORT_FIELDS):
+            raise ValueError("Unknown attribute: ${0}.{1}".format(var, attr))
+
+        variables.append((var, attr))
+        return "{{{0}}}".format(len(variables) - 1)
+
+    fmt = VARIABLE.sub(replace_var,
+                       arg.replace("{", "{{").replace("}", "}}"))
+    if not variables:
+        return arg
+
+    return ArgTemplate(fmt, tuple(variables))
+
+
+def button_bits(buttons):
+    """Returns the bits of buttons in DSReport.button_mask."""
+    mask = 0
+    for button in buttons:
+        if button not in BUTTON_FIELDS:
+            raise ValueError("Not a button: {0}".format(button))
+
+        mask |= 1 << BUTTON_FIELDS.index(button)
+
+    return mask
+
+
+def parse_action(action):
+    """Parses an action into an ActionTemplate.
+
+    Raises ValueError for invalid actions, unknown variables and
+    arguments that don't fit the action.
+    """
+    try:
+        action_split = shlex.split(action)
+    except ValueError as err:
+        raise ValueError("{0}: {1}".format(err, action))
+
+    if not action_split:
+        raise ValueError("Empty action")
+
+    action_type = action_split[0]
+    func = ReportActionBinding.actions.get(action_type)
+    if not func:
+        raise ValueError("Invalid action type: {0}".format(action_type))
+
+    # The controller is passed as the first argument when run
+    args = tuple(map(parse_arg, action_split[1:]))
+    try:
+        signature(func).bind(None, *args)
+    except TypeError:
+        raise ValueError("Wrong number of arguments: {0}".format(action))
+
+    variables = any(isinstance(arg, ArgTemplate) for arg in args)
+    return ActionTemplate(action_type, func, args, variables)
+
+
+def parse_bindings(name, section):
+    """Returns the combos and parsed actions of a bindings section.
+
+    Raises ValueError for the first invalid binding.
+    """
+    templates = []
+    for combo, action in section.items():
+        try:
+            button_bits(combo)
+            templates.append((combo, parse_action(action)))
+        except ValueError as err:
+            raise ValueError("Invalid binding {0} in bindings {1}: "
+                             "{2}".format("+".join(combo), name, err))
+
+    return templates
 
 
 class ReportActionBinding(ReportAction):
@@ -26,10 +135,15 @@ class ReportActionBinding(ReportAction):
 
     actions = {}
 
+    # Actions that block, run by the controller's action queue
+    blocking_actions = set()
+
     @classmethod
-    def action(cls, name):
+    def action(cls, name, blocking=False):
         def decorator(func):
             cls.actions[name] = func
+            if blocking:
+                cls.blocking_actions.add(name)
             return func
 
         return decorator
@@ -39,21 +153,45 @@ class ReportActionBinding(ReportAction):
 
         self.bindings = []
         self.active = set()
+        self.button_mask = 0
+        self.queue = controller.executor.create_queue(logger=self.logger)
+
+    def disable(self):
+        stats = self.queue.stats
+        if stats.submitted:
+            self.logger.info("Ran {0} binding actions ({1} failed, {2} "
+                             "dropped), queue depth max {3}, wait mean "
+                             "{4:.1f} ms max {5:.1f} ms, run mean {6:.1f} ms "
+                             "max {7:.1f} ms", stats.completed, stats.failed,
+                             stats.dropped, stats.max_depth,
+                             stats.wait_mean * 1000, stats.wait_max * 1000,
+                             stats.run_mean * 1000, stats.run_max * 1000)
 
     def add_binding(self, combo, callback, *args):
         modifiers, button = combo[:-1], combo[-1]
-        binding = ActionBinding(modifiers, button, callback, args)
+
+        try:
+            binding = ActionBinding(button_bits(modifiers),
+                                    button_bits((button,)), callback, args)
+        except ValueError as err:
+            self.logger.warning("Ignoring binding {0}: {1}",
+                                "+".join(combo), err)
+            return
+
         self.bindings.append(binding)
 
     def load_options(self, options):
         self.active = set()
         self.bindings = []
+        self.button_mask = 0
+        self.queue.size = options.action_queue_size
 
-        bindings = (self.controller.bindings["global"].items(),
-                    self.controller.bindings.get(options.bindings, {}).items())
+        # Parsed by parse_bindings() when the config was loaded
+        bindings = (self.controller.bindings["global"],
+                    self.controller.bindings.get(options.bindings, ()))
 
-        for binding, action in chain(*bindings):
-            self.add_binding(binding, self.handle_binding_action, action)
+        for binding, template in chain(*bindings):
+            self.add_binding(binding, self.handle_binding_action, template)
 
         have_profiles = (self.controller.profiles and
                          len(self.controller.profiles) > 1)
@@ -61,73 +199,85 @@ class ReportActionBinding(ReportAction):
             self.add_binding(self.controller.default_profile.profile_toggle,
                              lambda r: self.controller.next_profile())
 
-    def handle_binding_action(self, report, action):
+    def expand_args(self, template, report):
+        """The arguments of an action with the values of its variables."""
+        if not template.variables:
+            return template.args
+
         info = dict(name=self.controller.device.name,
                     profile=self.controller.current_profile,
                     device_addr=self.controller.device.device_addr,
                     report=report)
 
-        def replace_var(match):
-            var, attr = match.group("var", "attr")
-            var = info.get(var)
-            if attr:
-                var = getattr(var, attr, None)
-            return str(var)
+        args = []
+        for arg in template.args:
+            if isinstance(arg, ArgTemplate):
+                arg = arg.format.format(*[
+                    getattr(info[var], attr) if attr else info[var]
+                    for var, attr in arg.variables])
 
-        action = re.sub(r"\$(?P<var>\w+)(\.(?P<attr>\w+))?",
-                        replace_var, action)
-        action_split = shlex.split(action)
-        action_type = action_split[0]
-        action_args = action_split[1:]
+            args.append(arg)
+
+        return args
+
+    def handle_binding_action(self, report, template):
+        args = self.expand_args(template, report)
 
-        func = self.actions.get(action_type)
-        if func:
+        if template.type in self.blocking_actions:
+            if not self.queue.submit(template.func, self.controller, *args):
+                self.logger.warning("Dropped action {0}, {1} actions are "
+                                    "queued", template.type,
+                                    self.queue.depth)
+        else:
             try:
-                func(self.controller, *action_args)
+                template.func(self.controller, *args)
             except Exception as err:
                 self.logger.error("Failed to execute action: {0}", err)
-        else:
-            self.logger.error("Invalid action type: {0}", action_type)
 
     def handle_report(self, report):
-        for binding in self.bindings:
-            modifiers = True
-            for button in binding.modifiers:
-                modifiers = modifiers and getattr(report, button)
+        # Bindings only change state when a button does
+        mask = report.button_mask
+        if mask == self.button_mask:
+            return
 
-            active = getattr(report, binding.button)
-            released = not active
+        self.button_mask = mask
 
-            if modifiers and active and binding not in self.active:
-                self.active.add(binding)
-            elif released and binding in self.active:
+        for binding in self.bindings:
+            if mask & binding.button_mask:
+                modifiers = binding.modifier_mask
+                if (mask & modifiers == modifiers and
+                        binding not in self.active):
+                    self.active.add(binding)
+            elif binding in self.active:
                 self.active.remove(binding)
                 binding.callback(report, *binding.args)
 
 
-@ReportActionBinding.action("exec")
+@ReportActionBinding.action("exec", blocking=True)
 def exec_(controller, cmd, *args):
-    """Executes a subprocess in the foreground, blocking until returned."""
+    """Executes a subprocess in the foreground, the controller's next
+    exec actions wait until it has returned.
+
+    Raises when the process can't be started, fails or is killed after
+    --action-timeout.
+    """
     controller.logger.info("Executing: {0} {1}", cmd, " ".join(args))
 
-    try:
-        subprocess.check_call([cmd] + list(args))
-    except (OSError, subprocess.CalledProcessError) as err:
-        controller.logger.error("Failed to execute process: {0}", err)
+    timeout = controller.options.action_timeout or None
+    subprocess.check_call([cmd] + list(args), timeout=timeout)
 
 
-@ReportActionBinding.action("exec-background")
+@ReportActionBinding.action("exec-background", blocking=True)
 def exec_background(controller, cmd, *args):
-    """Executes a subprocess in the background."""
+    """Executes a subprocess in the background.
+
+    Raises when the process can't be started.
+    """
     controller.logger.info("Executing in the background: {0} {1}",
                            cmd, " ".join(args))
 
-    try:
-        subprocess.Popen([cmd] + list(args),
-                         stdout=open(os.devnull, "wb"),
-                         stderr=open(os.devnull, "wb"))
-    except OSError as err:
-        controller.logger.error("Failed to execute process: {0}", err)
+    subprocess.Popen([cmd] + list(args), stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL)
 
 
 @ReportActionBinding.action("next-profile")
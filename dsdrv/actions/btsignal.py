@@ -12,6 +12,7 @@ class ReportActionBTSignal(ReportAction):
 
     def setup(self, device):
         self.reports = 0
+        self.skipped_reports = 0
         self.signal_warned = False
 
         if device.type == "bluetooth":
@@ -27,6 +28,12 @@ class ReportActionBTSignal(ReportAction):
         self.timer_reset.stop()
 
     def check_signal(self, report):
+        # Unchanged reports that were skipped still count
+        report_filter = self.controller.device.report_filter
+        if report_filter:
+            self.reports += report_filter.skipped - self.skipped_reports
+            self.skipped_reports = report_filter.skipped
+
         # Less than 60 reports/s means we are probably dropping
         # reports between frames in a 60 FPS game.
         rps = int(self.reports / 2.5)
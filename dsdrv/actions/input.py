@@ -23,27 +23,52 @@ ReportAction.add_option("--mapping", metavar="mapping",
                              "config file")
 ReportAction.add_option("--trackpad-mouse", action="store_true",
                         help="Makes the trackpad control the mouse")
+ReportAction.add_option("--mouse-rate", metavar="HZ", type=float, default=200,
+                        help="Mouse updates per second while the trackpad is "
+                             "touched or a stick mapped to the mouse is "
+                             "moved. Default is 200")
+
+
+def joystick_layout(options):
+    """The name of the joystick layout of a set of options."""
+    if options.mapping:
+        return options.mapping
+    elif options.emulate_xboxdrv:
+        return "xboxdrv"
+    elif options.emulate_xpad:
+        return "xpad"
+    elif options.emulate_xpad_wireless:
+        return "xpad_wireless"
+    else:
+        return "ds4"
+
 
 class ReportActionInput(ReportAction):
-    """Creates virtual input devices via uinput."""
+    """Creates virtual input devices via uinput.
+
+    The devices of every layout used by the controller's profiles are
+    created when a device is connected and kept, so switching profiles
+    only switches the device that is written to. Idle devices are left
+    reset. Dynamic controllers close them again on disconnection.
+    """
 
     def __init__(self, *args, **kwargs):
         super(ReportActionInput, self).__init__(*args, **kwargs)
 
+        self.devices = {}
         self.joystick = None
-        self.joystick_layout = None
         self.mouse = None
 
-        # USB has a report frequency of 4 ms while BT is 2 ms, so we
-        # use 5 ms between each mouse emit to keep it consistent and to
-        # allow for at least one fresh report to be received inbetween
-        self.timer = self.create_timer(0.005, self.emit_mouse)
-
-    def setup(self, device):
-        self.timer.start()
+        # USB has a report frequency of 4 ms while BT is 2 ms, so the
+        # default of 5 ms between each mouse emit keeps it consistent and
+        # allows for at least one fresh report to be received inbetween.
+        # The timer only runs while there is mouse motion.
+        self.mouse_rate = None
+        self.timer = None
 
     def disable(self):
-        self.timer.stop()
+        if self.timer:
+            self.timer.stop()
 
         if self.joystick:
             self.joystick.emit_reset()
@@ -51,57 +76,101 @@ class ReportActionInput(ReportAction):
         if self.mouse:
             self.mouse.emit_reset()
 
+        # A dynamic controller is dropped after the disconnection
+        if self.controller.dynamic:
+            self.close_devices()
+
+    def close_devices(self):
+        """Closes the devices of the pool."""
+        for device in self.devices.values():
+            device.device.close()
+
+        self.devices = {}
+        self.joystick = None
+        self.mouse = None
+
+    def pooled_device(self, layout, sensors=False):
+        """Returns the device of a layout, created the first time."""
+        key = (layout, sensors)
+        device = self.devices.get(key)
+        if not device:
+            device = self.devices[key] = create_uinput_device(layout,
+                                                              sensors)
+            if device.joystick_dev and device.device.device:
+                self.logger.info("Created devices {0} (joystick) "
+                                 "{1} (evdev) ", device.joystick_dev,
+                                 device.device.device.fn)
+
+        return device
+
+    def create_devices(self):
+        """Creates the devices of all profiles the controller cycles
+        through. Profiles loaded otherwise get theirs when loaded."""
+        names = self.controller.profiles or ["default"]
+        for name in names:
+            options = self.controller.profile_options.get(name)
+            if not options:
+                continue
+
+            self.pooled_device(joystick_layout(options), options.sensors)
+            if options.trackpad_mouse:
+                self.pooled_device("mouse")
+
+    def switch_device(self, current, device):
+        """Resets the current device when switching to another one."""
+        if current and current is not device:
+            current.emit_reset()
+
+        return device
+
+    def select_devices(self, options):
+        """Switches to the devices of options, creating the pool if
+        needed."""
+        if not self.devices:
+            self.create_devices()
+
+        mouse = options.trackpad_mouse and self.pooled_device("mouse")
+        self.mouse = self.switch_device(self.mouse, mouse or None)
+
+        joystick = self.pooled_device(joystick_layout(options),
+                                      options.sensors)
+        self.joystick = self.switch_device(self.joystick, joystick)
+
+        ignored_buttons = set(options.ignored_buttons)
+
+        # If the profile binding is a single button we don't want to
+        # send it to the joystick at all
+        if (self.controller.profiles and
+            self.controller.default_profile.profile_toggle and
+            len(self.controller.default_profile.profile_toggle) == 1):
+
+            button = self.controller.default_profile.profile_toggle[0]
+            ignored_buttons.add(button)
+
+        # Only compiles the emit plan when the buttons changed
+        self.joystick.set_ignored_buttons(ignored_buttons)
+
     def load_options(self, options):
         try:
-            if options.mapping:
-                joystick_layout = options.mapping
-            elif options.emulate_xboxdrv:
-                joystick_layout = "xboxdrv"
-            elif options.emulate_xpad:
-                joystick_layout = "xpad"
-            elif options.emulate_xpad_wireless:
-                joystick_layout = "xpad_wireless"
-            else:
-                joystick_layout = "ds4"
-
-            if not self.mouse and options.trackpad_mouse:
-                self.mouse = create_uinput_device("mouse")
-            elif self.mouse and not options.trackpad_mouse:
-                self.mouse.device.close()
-                self.mouse = None
-
-            if self.joystick and self.joystick_layout != joystick_layout:
-                self.joystick.device.close()
-                joystick = create_uinput_device(joystick_layout)
-                self.joystick = joystick
-            elif not self.joystick:
-                joystick = create_uinput_device(joystick_layout)
-                self.joystick = joystick
-                if joystick.device.device:
-                    self.logger.info("Created devices {0} (joystick) "
-                                     "{1} (evdev) ", joystick.joystick_dev,
-                                     joystick.device.device.fn)
-            else:
-                joystick = None
-
-            self.joystick.ignored_buttons = set()
-            for button in options.ignored_buttons:
-                self.joystick.ignored_buttons.add(button)
-
-            if joystick:
-                self.joystick_layout = joystick_layout
-
-                # If the profile binding is a single button we don't want to
-                # send it to the joystick at all
-                if (self.controller.profiles and
-                    self.controller.default_profile.profile_toggle and
-                    len(self.controller.default_profile.profile_toggle) == 1):
-
-                    button = self.controller.default_profile.profile_toggle[0]
-                    self.joystick.ignored_buttons.add(button)
+            # The devices are created once a device is connected, the
+            # controller loads its options again after setting it up
+            if self.controller.device:
+                self.select_devices(options)
+
+            if options.mouse_rate != self.mouse_rate:
+                if self.timer:
+                    self.timer.stop()
+
+                self.mouse_rate = options.mouse_rate
+                self.timer = self.create_timer(1.0 / options.mouse_rate,
+                                               self.emit_mouse)
         except DeviceError as err:
             self.controller.exit("Failed to create input device: {0}", err)
 
+    def mouse_motion(self, report):
+        return ((self.joystick and self.joystick.mouse_motion(report)) or
+                (self.mouse and self.mouse.mouse_motion(report)))
+
     def emit_mouse(self, report):
         if self.joystick:
             self.joystick.emit_mouse(report)
@@ -109,7 +178,9 @@ class ReportActionInput(ReportAction):
         if self.mouse:
             self.mouse.emit_mouse(report)
 
-        return True
+        # Stops once a report without motion has been emitted, which
+        # also resets the trackpad position and the scrolling
+        return self.mouse_motion(report)
 
     def handle_report(self, report):
         if self.joystick:
@@ -117,3 +188,6 @@ class ReportActionInput(ReportAction):
 
         if self.mouse:
             self.mouse.emit(report)
+
+        if self.timer and not self.timer.active and self.mouse_motion(report):
+            self.timer.start()
@@ -0,0 +1,47 @@
+from time import monotonic
+
+from ..action import Action
+from ..shm import StateWriter, state_path
+
+Action.add_option("--shm", action="store_true",
+                  help="Publishes the controller state to other local "
+                       "processes in /dev/shm/dsdrv-<controller>, see "
+                       "dsdrv.shm for the reader")
+
+
+class ActionSharedState(Action):
+    """Publishes every report to a shared memory state file."""
+
+    def __init__(self, *args, **kwargs):
+        super(ActionSharedState, self).__init__(*args, **kwargs)
+        self.writer = None
+
+    def enable(self):
+        if self.writer:
+            return
+
+        path = state_path(self.controller.index)
+        try:
+            self.writer = StateWriter(path)
+        except (OSError, IOError) as err:
+            self.logger.error("Failed to create {0}: {1}", path, err)
+            return
+
+        self.register_event("device-report", self.publish)
+
+    def disable(self):
+        if not self.writer:
+            return
+
+        self.unregister_event("device-report", self.publish)
+        self.writer.close()
+        self.writer = None
+
+    def load_options(self, options):
+        if options.shm and self.controller.device:
+            self.enable()
+        else:
+            self.disable()
+
+    def publish(self, report):
+        self.writer.publish(report, monotonic())
@@ -57,6 +57,7 @@ class ReportActionStatus(ReportAction):
 
             self.logger.info("Audio: {0}", plug_audio)
 
-        self.report = report
+        # Keep it for comparison on the next check
+        self.report = report.retain()
 
         return True
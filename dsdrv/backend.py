@@ -3,9 +3,20 @@ class Backend(object):
 
     __name__ = "backend"
 
+    # Set from the --skip-unchanged-reports and --report-heartbeat options
+    skip_unchanged_reports = False
+    report_heartbeat = 0.1
+
     def __init__(self, manager):
         self.logger = manager.new_module(self.__name__)
 
+    def configure_device(self, device):
+        """Applies the backend's report options to a new device."""
+        if self.skip_unchanged_reports:
+            device.skip_unchanged_reports(self.report_heartbeat)
+
+        return device
+
     def setup(self):
         """Initialize the backend and make it ready for scanning.
 
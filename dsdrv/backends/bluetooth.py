@@ -4,7 +4,6 @@ import subprocess
 from ..backend import Backend
 from ..exceptions import BackendError, DeviceError
 from ..device import DSDevice
-from ..utils import zero_copy_slice
 from ..controllers import controllers
 
 
@@ -19,6 +18,11 @@ REPORT_SIZE = 79
 
 
 class BluetoothDSDevice(DSDevice):
+    report_size = REPORT_SIZE
+
+    # Cut off bluetooth data
+    report_offset = 3
+
     @classmethod
     def connect(cls, addr):
         ctl_socket = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET,
@@ -37,7 +41,6 @@ class BluetoothDSDevice(DSDevice):
         return cls(addr, ctl_socket, int_socket)
 
     def __init__(self, addr, ctl_sock, int_sock):
-        self.buf = bytearray(REPORT_SIZE)
         self.ctl_sock = ctl_sock
         self.int_sock = int_sock
         self.report_fd = int_sock.fileno()
@@ -45,24 +48,14 @@ class BluetoothDSDevice(DSDevice):
         super(BluetoothDSDevice, self).__init__(addr.upper(), addr,
                                                  "bluetooth", controllers.DualShock4)
 
-    def read_report(self):
+    def read_raw(self, buf):
         try:
-            ret = self.int_sock.recv_into(self.buf)
-        except IOError:
-            return
-
-        # Disconnection
-        if ret == 0:
-            return
-
-        # Invalid report size or id, just ignore it
-        if ret < REPORT_SIZE or self.buf[1] != REPORT_ID:
-            return False
-
-        # Cut off bluetooth data
-        buf = zero_copy_slice(self.buf, 3)
+            return self.int_sock.recv_into(buf, 0, socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return None
 
-        return self.parse_report(buf)
+    def valid_report(self, buf, size):
+        return size >= REPORT_SIZE and buf[1] == REPORT_ID
 
     def write_report(self, report_id, data):
         hid = bytearray((HIDP_TRANS_SET_REPORT | HIDP_DATA_RTYPE_OUTPUT,
@@ -119,7 +112,8 @@ class BluetoothBackend(Backend):
         for bdaddr, name in self.scan():
             if name == "Wireless Controller":
                 self.logger.info("Found device {0}", bdaddr)
-                return BluetoothDSDevice.connect(bdaddr)
+                device = BluetoothDSDevice.connect(bdaddr)
+                return self.configure_device(device)
 
     @property
     def devices(self):
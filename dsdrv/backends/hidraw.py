@@ -11,7 +11,6 @@ from pyudev import Context, Monitor
 from ..backend import Backend
 from ..exceptions import DeviceError
 from ..device import DSDevice
-from ..utils import zero_copy_slice
 from ..controllers import controllers, determineGenerationHidraw
 
 
@@ -32,40 +31,25 @@ class HidrawDSDevice(DSDevice):
         except (OSError, IOError) as err:
             raise DeviceError(err)
 
-        self.buf = bytearray(self.report_size)
         self.controller = determineGenerationHidraw(self.input_device)
 
-        super(HidrawDSDevice, self).__init__(
-            name, addr, type, self.controller)
-
-    def read_report(self):
-        try:
-            ret = self.fd.readinto(self.buf)
-        except IOError:
-            return
-
-        # Disconnection
-        if ret == 0:
-            return
-
-        # Invalid report size or id, just ignore it
-        if ret < self.report_size or self.buf[0] != self.valid_report_id:
-            return False
-
-        if self.type == "bluetooth":
+        offset = self.controller.value.bluetoothOffset_in
+        if type == "bluetooth":
             # Cut off bluetooth data
-            if (self.controller.value.bluetoothOffset_in > 0):
-                buf = zero_copy_slice(self.buf, self.controller.value.bluetoothOffset_in)
-            else:
-                buf = self.buf
+            self.report_offset = max(offset, 0)
         else:
             # Or USB data, depending on the offset
-            if (self.controller.value.bluetoothOffset_in < 0):
-                buf = zero_copy_slice(self.buf, abs(self.controller.value.bluetoothOffset_in))
-            else:
-                buf = self.buf
+            self.report_offset = max(-offset, 0)
 
-        return self.parse_report(buf)
+        super(HidrawDSDevice, self).__init__(
+            name, addr, type, self.controller)
+
+    def read_raw(self, buf):
+        # None if there is nothing to read
+        return self.fd.readinto(buf)
+
+    def valid_report(self, buf, size):
+        return size >= self.report_size and buf[0] == self.valid_report_id
 
     def read_feature_report(self, report_id, size):
         op = HIDIOCGFEATURE(size + 1)
@@ -189,11 +173,13 @@ class HidrawBackend(Backend):
                 else:
                     device_name = hidraw_device.sys_name
 
-                yield cls(name=device_name,
-                          addr=device_addr,
-                          type=cls.__type__,
-                          hidraw_device=hidraw_device.device_node,
-                          event_device=event_device)
+                device = cls(name=device_name,
+                             addr=device_addr,
+                             type=cls.__type__,
+                             hidraw_device=hidraw_device.device_node,
+                             event_device=event_device)
+
+                yield self.configure_device(device)
 
             except DeviceError as err:
                 self.logger.error("Unable to open DS device: {0}", err)
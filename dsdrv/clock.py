@@ -0,0 +1,165 @@
+"""Maps the report counter of a device to the host's monotonic clock."""
+
+from collections import deque
+from math import sqrt
+
+# DSReport.timestamp is a 6 bit counter that increases with every report
+COUNTER_RANGE = 64
+
+# Report intervals are nominally a multiple of a USB microframe, the
+# drift is the difference between the measured and the nominal interval
+NOMINAL_RESOLUTION = 0.000125
+
+
+class DeviceClock(object):
+    """Puts the reports of a device on a stable host timeline.
+
+    The host times at which reports are read include scheduling jitter,
+    while the device sends them at a steady rate. A line is fitted
+    through the unwrapped report counter and the read times of the last
+    window seconds, which gives the time of a report without the jitter.
+
+    The counter wraps around quickly, so the number of wraps between two
+    reports is estimated from the time between them.
+    """
+
+    # Samples are kept relative to an origin that is moved forward every
+    # this many counts, to keep the running sums precise
+    rebase_interval = 8192
+    # Samples needed before the fitted line is used
+    min_samples = 8
+
+    def __init__(self, window=2.0, counter_range=COUNTER_RANGE):
+        self.window = window
+        self.counter_range = counter_range
+        self.samples = deque()
+        self.reset()
+
+    def reset(self):
+        """Forgets all samples, e.g. after a reconnect."""
+        self.samples.clear()
+        self.counter = None
+        self.host = None
+        self.ticks = 0
+        self.origin_ticks = 0
+        self.origin_host = 0.0
+        self.sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+        # Seconds per count, host time of count origin_ticks and the
+        # standard deviation of the read times from the fitted line
+        self.period = None
+        self.offset = 0.0
+        self.jitter = 0.0
+
+    def update(self, counter, host):
+        """Adds a report read at host time, returns its fitted time."""
+        if self.counter is None:
+            self.counter, self.host = counter, host
+            self.origin_host = host
+            self._add(0, 0.0)
+            return host
+
+        delta = (counter - self.counter) % self.counter_range
+        if self.period:
+            # Reports lost or skipped for a whole wrap or more
+            expected = (host - self.host) / self.period
+            wraps = round((expected - delta) / self.counter_range)
+            if wraps > 0:
+                delta += wraps * self.counter_range
+
+        self.counter, self.host = counter, host
+        if not delta:
+            return self.time()
+
+        self.ticks += delta
+        if self.ticks - self.origin_ticks >= self.rebase_interval:
+            self._rebase()
+
+        self._add(self.ticks - self.origin_ticks, host - self.origin_host)
+
+        while host - self.samples[0][1] - self.origin_host > self.window:
+            self._remove(*self.samples[0])
+
+        self._fit()
+
+        return self.time()
+
+    def time(self, counter=None):
+        """Returns the fitted host time of a report counter.
+
+        Defaults to the latest report, earlier counters are assumed to be
+        within one wrap of it.
+        """
+        ticks = self.ticks
+        if counter is not None and self.counter is not None:
+            ticks -= (self.counter - counter) % self.counter_range
+
+        if self.period is None:
+            if self.host is None:
+                return None
+
+            return self.host
+
+        return (self.origin_host + self.offset +
+                self.period * (ticks - self.origin_ticks))
+
+    @property
+    def drift_ppm(self):
+        """How much slower the device is than its nominal report rate."""
+        if not self.period:
+            return 0.0
+
+        nominal = max(round(self.period / NOMINAL_RESOLUTION), 1) * \
+            NOMINAL_RESOLUTION
+        return (self.period / nominal - 1) * 1e6
+
+    def _add(self, t, h):
+        self.samples.append((t, h))
+        sums = self.sums
+        sums[0] += 1
+        sums[1] += t
+        sums[2] += h
+        sums[3] += t * t
+        sums[4] += t * h
+        sums[5] += h * h
+
+    def _remove(self, t, h):
+        self.samples.popleft()
+        sums = self.sums
+        sums[0] -= 1
+        sums[1] -= t
+        sums[2] -= h
+        sums[3] -= t * t
+        sums[4] -= t * h
+        sums[5] -= h * h
+
+    def _rebase(self):
+        """Moves the origin to the oldest sample and recomputes the sums,
+        which also drops the rounding errors of adding and removing."""
+        t0, h0 = self.samples[0]
+        samples = [(t - t0, h - h0) for t, h in self.samples]
+
+        self.origin_ticks += t0
+        self.origin_host += h0
+        self.offset -= h0 - (self.period or 0.0) * t0
+
+        self.samples.clear()
+        self.sums = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        for t, h in samples:
+            self._add(t, h)
+
+    def _fit(self):
+        n, st, sh, stt, sth, shh = self.sums
+        if n < self.min_samples:
+            return
+
+        var_t = stt - st * st / n
+        if var_t <= 0:
+            return
+
+        cov = sth - st * sh / n
+        period = cov / var_t
+
+        self.period = period
+        self.offset = (sh - period * st) / n
+        self.jitter = sqrt(max(shh - sh * sh / n - period * cov, 0.0) / n)
@@ -55,6 +55,20 @@ backendopt = parser.add_argument_group("backend options")
 backendopt.add_argument("--no-hidraw", action="store_true",
                         help="Don't use hidraw - use bluetooth directly instead"
                              "Note: DualSense not supported in direct Bluetooth mode")
+backendopt.add_argument("--skip-unchanged-reports", action="store_true",
+                        help="Don't process reports where no input has "
+                             "changed since the previous report")
+backendopt.add_argument("--report-heartbeat", metavar="seconds", type=float,
+                        default=0.1,
+                        help="Longest time between processed reports when "
+                             "using --skip-unchanged-reports. "
+                             "Default is 0.1")
+
+loopopt = parser.add_argument_group("event loop options")
+loopopt.add_argument("--single-reactor", action="store_true",
+                     help="Run all controllers and the UDP and Unix socket "
+                          "servers in a single event loop instead of a "
+                          "thread for each of them")
 
 daemonopt = parser.add_argument_group("daemon options")
 daemonopt.add_argument("--daemon", action="store_true",
@@ -75,6 +89,35 @@ udpopt.add_argument("--udp-port", metavar="PORT", type=int, default=26760,
                     help="Port that will be listened by the UDP server")
 udpopt.add_argument("--udp-remap-buttons", action="store_true",
                     help="Swap A-B and X-Y in UDP reports")
+udpopt.add_argument("--udp-rate", metavar="HZ", type=float, default=0,
+                    help="Maximum packets per second sent to all UDP "
+                         "clients together, button changes are always "
+                         "sent right away")
+udpopt.add_argument("--udp-client-rate", metavar="HZ", type=float,
+                    default=0,
+                    help="Maximum packets per second sent to each UDP "
+                         "client, e.g. 60 for a game running at 60 fps")
+udpopt.add_argument("--udp-idle-rate", metavar="HZ", type=float, default=0,
+                    help="Packets per second sent to each UDP client while "
+                         "the controller state doesn't change")
+
+unixopt = parser.add_argument_group("Unix socket server options")
+unixopt.add_argument("--unix", action="store_true",
+                     help="Stream raw or decoded reports to local processes "
+                          "via a Unix socket, see dsdrv.servers.unix")
+unixopt.add_argument("--unix-path", metavar="path", default=None,
+                     help="Path of the Unix socket. Default is "
+                          "$XDG_RUNTIME_DIR/dsdrv.sock")
+unixopt.add_argument("--unix-queue-size", metavar="records", type=int,
+                     default=64,
+                     help="Records queued for a slow client before the "
+                          "oldest are dropped. Default is 64")
+
+bindingopt = parser.add_argument_group("binding options")
+bindingopt.add_argument("--action-workers", metavar="count", type=int,
+                        default=4,
+                        help="Exec binding actions of different controllers "
+                             "that can run at the same time. Default is 4")
 
 controllopt = parser.add_argument_group("controller options")
 
@@ -230,12 +273,15 @@ def load_options():
         profile_options.parent = options
         options.profiles[name] = profile_options
 
+    # Imported here, the actions need the options of this module
+    from .actions.binding import parse_bindings
+
     options.bindings = {}
-    options.bindings["global"] = config.section("bindings",
-                                                key_type=parse_button_combo)
+    options.bindings["global"] = parse_bindings(
+        "global", config.section("bindings", key_type=parse_button_combo))
     for name, section in config.sections("bindings"):
-        options.bindings[name] = config.section(section,
-                                                key_type=parse_button_combo)
+        options.bindings[name] = parse_bindings(
+            name, config.section(section, key_type=parse_button_combo))
 
     for name, section in config.sections("mapping"):
         mapping = config.section(section)
@@ -265,4 +311,12 @@ add_controller_option("--profiles", metavar="profiles",
                       help="Profiles to cycle through using the button "
                            "specified by --profile-toggle, e.g. "
                            "'profile1,profile2'")
-
+add_controller_option("--sensors", action="store_true",
+                      help="Decode the accelerometer and gyroscope, used "
+                           "by the UDP server and the ds4 joystick layout")
+add_controller_option("--report-policy", metavar="policy",
+                      choices=("all", "latest"), default="all",
+                      help="Which of the reports that queued up while "
+                           "busy to process: 'all' of them or only the "
+                           "'latest' one, with the button presses of the "
+                           "others merged in")
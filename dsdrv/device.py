@@ -1,7 +1,11 @@
 import math
+from collections import namedtuple
+from operator import itemgetter
+from time import monotonic
 from zlib import crc32
 from struct import Struct, pack
 from sys import version_info as sys_version
+from .clock import DeviceClock
 from .controllers import controllers, controller
 
 class StructHack(Struct):
@@ -14,12 +18,25 @@ class StructHack(Struct):
 
 
 if sys_version[:3] <= (2, 7, 4):
-    S16LE = StructHack("<h")
+    ReportStruct = StructHack
 else:
-    S16LE = Struct("<h")
+    ReportStruct = Struct
 
+S16LE = ReportStruct("<h")
+S16LE_VECTOR = ReportStruct("<3h")
 
-class DSReport(object):
+
+class ReportState(object):
+    """Bookkeeping of a report.
+
+    Kept separate from DSReport so that DSReport.__slots__ only lists
+    the values of the report.
+    """
+
+    __slots__ = ["retained", "raw", "decoder", "decoded", "button_mask"]
+
+
+class DSReport(ReportState):
     __slots__ = ["left_analog_x",
                  "left_analog_y",
                  "right_analog_x",
@@ -44,13 +61,12 @@ class DSReport(object):
                  "button_options",
                  "button_trackpad",
                  "button_ps",
-                 # TODO: disable sensors on a config parameter instead of commenting out
-                #  "motion_y",
-                #  "motion_x",
-                #  "motion_z",
-                #  "orientation_roll",
-                #  "orientation_yaw",
-                #  "orientation_pitch",
+                 "motion_y",
+                 "motion_x",
+                 "motion_z",
+                 "orientation_roll",
+                 "orientation_yaw",
+                 "orientation_pitch",
                  "trackpad_touch0_id",
                  "trackpad_touch0_active",
                  "trackpad_touch0_x",
@@ -66,9 +82,416 @@ class DSReport(object):
                  "plug_mic"]
 
     def __init__(self, *args, **kwargs):
+        self.retained = False
+        self.raw = None
+        self.decoder = None
+        self.decoded = 0
+
         for i, value in enumerate(args):
             setattr(self, self.__slots__[i], value)
 
+        self.button_mask = pack_buttons(self) if args else 0
+
+    def __getattr__(self, name):
+        # Only called for values that have not been decoded yet
+        group = LAZY_FIELDS.get(name)
+        if not group or not self.decoder:
+            raise AttributeError(name)
+
+        getattr(self.decoder, group.decode)(self.raw, self)
+        self.decoded |= group.flag
+
+        return object.__getattribute__(self, name)
+
+    def forget(self):
+        """Removes the lazily decoded values, used before refilling."""
+        for group in LAZY_GROUPS:
+            if self.decoded & group.flag:
+                for name in group.fields:
+                    delattr(self, name)
+
+        self.decoded = 0
+
+    def retain(self):
+        """Takes the report out of its device's report pool.
+
+        Reports delivered by a device are recycled and filled in place
+        with later reports. Call this to keep a report around for longer
+        than the handling of its device-report event.
+        """
+        self.retained = True
+        return self
+
+    def snapshot(self):
+        """Returns a copy of the report that will never be recycled."""
+        report = DSReport(*[getattr(self, key) for key in self.__slots__])
+        if self.raw is not None:
+            report.raw = bytearray(self.raw)
+
+        return report
+
+
+class ReportPool(object):
+    """A ring of preallocated reports and buffers that are reused.
+
+    A report and its buffer stay untouched until the pool has gone around
+    once, so the previous reports are still valid while a new one is read.
+    Retained reports are replaced, together with their buffer, when their
+    turn comes.
+    """
+
+    def __init__(self, size=3, buffer_size=0):
+        self.buffer_size = buffer_size
+        self.buffers = [bytearray(buffer_size) for i in range(size)]
+        self.reports = [DSReport() for i in range(size)]
+        self.index = 0
+
+    def buffer(self):
+        """Returns the buffer to read the next report into."""
+        index = (self.index + 1) % len(self.reports)
+
+        if self.reports[index].retained:
+            self.reports[index] = DSReport()
+            self.buffers[index] = bytearray(self.buffer_size)
+
+        return self.buffers[index]
+
+    def swap_buffer(self, buf):
+        """Puts buf in place of the buffer returned by buffer().
+
+        Returns the replaced buffer, which the pool no longer uses.
+        """
+        index = (self.index + 1) % len(self.reports)
+        replaced, self.buffers[index] = self.buffers[index], buf
+
+        return replaced
+
+    def next(self):
+        """Returns the report to fill next."""
+        self.index = index = (self.index + 1) % len(self.reports)
+
+        return self.reports[index]
+
+    @property
+    def latest(self):
+        """The report that was returned last by next()."""
+        return self.reports[self.index]
+
+
+def byte_table(func):
+    """Precomputes the result of func for every possible byte value."""
+    return tuple(func(value) for value in range(256))
+
+
+def compile_byte_layout(positions):
+    """Creates a struct that reads all the bytes at positions at once.
+
+    Returns the struct and a getter that puts the unpacked values back
+    in the same order as positions. Duplicate positions are only read
+    once.
+    """
+    unique = sorted(set(positions))
+    fmt, last = "<", 0
+    for position in unique:
+        if position > last:
+            fmt += "{0}x".format(position - last)
+        fmt += "B"
+        last = position + 1
+
+    order = itemgetter(*[unique.index(position) for position in positions])
+
+    return ReportStruct(fmt), order
+
+
+# dpad_up, dpad_down, dpad_left, dpad_right
+DPAD_TABLE = byte_table(lambda v: ((v % 16) in (0, 1, 7), (v % 16) in (3, 4, 5),
+                                   (v % 16) in (5, 6, 7), (v % 16) in (1, 2, 3)))
+
+# button_cross, button_circle, button_square, button_triangle
+SYMBOLS_TABLE = byte_table(lambda v: (v & 32 != 0, v & 64 != 0,
+                                      v & 16 != 0, v & 128 != 0))
+
+# button_l1, button_l2, button_l3, button_r1, button_r2, button_r3,
+# button_share, button_options
+SHOULDER_TABLE = byte_table(lambda v: (v & 1 != 0, v & 4 != 0, v & 64 != 0,
+                                       v & 2 != 0, v & 8 != 0, v & 128 != 0,
+                                       v & 16 != 0, v & 32 != 0))
+
+# button_trackpad, button_ps
+TRACKPADPS_TABLE = byte_table(lambda v: (v & 2 != 0, v & 1 != 0))
+
+# The buttons in the order of their bits in DSReport.button_mask
+BUTTON_FIELDS = DSReport.__slots__[6:24]
+
+
+def mask_table(table, shift):
+    """Packs the button values of table into bits, starting at shift."""
+    return tuple(sum(1 << (shift + i) for i, value in enumerate(values)
+                     if value)
+                 for values in table)
+
+
+DPAD_MASK = mask_table(DPAD_TABLE, 0)
+SYMBOLS_MASK = mask_table(SYMBOLS_TABLE, 4)
+SHOULDER_MASK = mask_table(SHOULDER_TABLE, 8)
+TRACKPADPS_MASK = mask_table(TRACKPADPS_TABLE, 16)
+
+
+def pack_buttons(report):
+    """Computes the button mask of a report from its button values."""
+    return sum(1 << i for i, name in enumerate(BUTTON_FIELDS)
+               if getattr(report, name, False))
+
+
+def set_buttons(report, mask, pressed):
+    """Sets the buttons in mask to pressed, keeping button_mask in sync."""
+    for i, name in enumerate(BUTTON_FIELDS):
+        if mask & (1 << i):
+            setattr(report, name, pressed)
+
+    if pressed:
+        report.button_mask |= mask
+    else:
+        report.button_mask &= ~mask
+
+# trackpad_touchN_id, trackpad_touchN_active
+TOUCH_TABLE = byte_table(lambda v: (v & 0x7f, (v >> 7) == 0))
+
+# battery, plug_usb, plug_audio, plug_mic
+BATTERY_TABLE = byte_table(lambda v: (v % 16, v & 16 != 0,
+                                      v & 32 != 0, v & 64 != 0))
+
+
+class ReportDecoder(object):
+    """Turns raw HID input reports into DSReport objects.
+
+    The decoder is compiled once for a controller layout and the offset
+    of the input data in the transport's buffer. The sticks, triggers
+    and buttons are read with a single struct unpack and the bit fields
+    are looked up in precomputed tables. The rarely used values are only
+    decoded when first accessed, see LAZY_GROUPS.
+    """
+
+    def __init__(self, layout, offset=0, sensors=False):
+        self.layout = layout
+        self.offset = offset
+        self.sensors = sensors
+
+        positions = (layout.lstick_start, layout.lstick_start + 1,
+                     layout.rstick_start, layout.rstick_start + 1,
+                     layout.l2_analog, layout.r2_analog,
+                     layout.dpadByte, layout.symbols, layout.rl_digital,
+                     layout.trackpadps)
+        touchpad = tuple(range(layout.touchpad_start,
+                               layout.touchpad_start + 8))
+
+        self.struct, self.order = compile_byte_layout(positions)
+        self.touchpad_struct = ReportStruct("<8B")
+        self.touchpad = offset + layout.touchpad_start
+        self.trackpadps = offset + layout.trackpadps
+        self.battery = offset + layout.batt_and_in
+        self.size = offset + max(positions + touchpad +
+                                 (layout.batt_and_in,)) + 1
+
+        # The upper bits of trackpadps are a report counter, so that byte
+        # is compared separately from the rest of the input values.
+        state = ([p for p in positions if p != layout.trackpadps] +
+                 list(touchpad) + [layout.batt_and_in])
+
+        # The sensor stage is only compiled in when asked for, otherwise
+        # the motion values are all zero.
+        if sensors:
+            self.accel = offset + layout.accel_start
+            self.gyro = offset + layout.gyro_start
+            self.decode_motion = self.decode_sensors
+            self.size = max(self.size, self.accel + 6, self.gyro + 6)
+
+            state += list(range(layout.accel_start, layout.accel_start + 6))
+            state += list(range(layout.gyro_start, layout.gyro_start + 6))
+
+        self.state_struct, _ = compile_byte_layout(state)
+
+    def input_state(self, buf):
+        """Returns all the input values of buf, in no particular order.
+
+        Used to cheaply compare reports, it leaves out the report counter
+        and, unless sensors are decoded, the sensor data which change on
+        every report.
+        """
+        return (self.state_struct.unpack_from(buf, self.offset),
+                buf[self.trackpadps] & 3)
+
+    def button_mask(self, buf):
+        """Returns the button mask of a buffer without decoding it."""
+        (lx, ly, rx, ry, l2, r2, dpad, symbols, shoulder, trackpadps) = \
+            self.order(self.struct.unpack_from(buf, self.offset))
+
+        return (DPAD_MASK[dpad] | SYMBOLS_MASK[symbols] |
+                SHOULDER_MASK[shoulder] | TRACKPADPS_MASK[trackpadps])
+
+    def decode(self, buf):
+        """Decodes a buffer into a new report."""
+        return self.decode_into(buf, DSReport())
+
+    def decode_into(self, buf, report):
+        """Decodes a buffer, overwriting all the values of report.
+
+        The report keeps a reference to buf to decode the remaining
+        values from when they are accessed.
+        """
+        (lx, ly, rx, ry, l2, r2, dpad, symbols, shoulder, trackpadps) = \
+            self.order(self.struct.unpack_from(buf, self.offset))
+
+        r = report
+        if r.decoded:
+            r.forget()
+
+        r.raw = buf
+        r.decoder = self
+
+        r.left_analog_x, r.left_analog_y = lx, ly
+        r.right_analog_x, r.right_analog_y = rx, ry
+        r.l2_analog, r.r2_analog = l2, r2
+
+        (r.dpad_up, r.dpad_down,
+         r.dpad_left, r.dpad_right) = DPAD_TABLE[dpad]
+        (r.button_cross, r.button_circle,
+         r.button_square, r.button_triangle) = SYMBOLS_TABLE[symbols]
+        (r.button_l1, r.button_l2, r.button_l3,
+         r.button_r1, r.button_r2, r.button_r3,
+         r.button_share, r.button_options) = SHOULDER_TABLE[shoulder]
+        r.button_trackpad, r.button_ps = TRACKPADPS_TABLE[trackpadps]
+        r.button_mask = (DPAD_MASK[dpad] | SYMBOLS_MASK[symbols] |
+                         SHOULDER_MASK[shoulder] | TRACKPADPS_MASK[trackpadps])
+
+        return r
+
+    def decode_touchpad(self, buf, report):
+        t0, t1, t2, t3, t4, t5, t6, t7 = \
+            self.touchpad_struct.unpack_from(buf, self.touchpad)
+
+        r = report
+
+        # Trackpad touch 1: id, active, x, y
+        r.trackpad_touch0_id, r.trackpad_touch0_active = TOUCH_TABLE[t0]
+        r.trackpad_touch0_x = ((t2 & 0x0f) << 8) | t1
+        r.trackpad_touch0_y = (t3 << 4) | (t2 >> 4)
+
+        # Trackpad touch 2: id, active, x, y
+        r.trackpad_touch1_id, r.trackpad_touch1_active = TOUCH_TABLE[t4]
+        r.trackpad_touch1_x = ((t6 & 0x0f) << 8) | t5
+        r.trackpad_touch1_y = (t7 << 4) | (t6 >> 4)
+
+    def decode_status(self, buf, report):
+        r = report
+
+        # Timestamp, battery and external inputs (usb, audio, mic)
+        r.timestamp = buf[self.trackpadps] >> 2
+        (r.battery, r.plug_usb,
+         r.plug_audio, r.plug_mic) = BATTERY_TABLE[buf[self.battery]]
+
+    def decode_motion(self, buf, report):
+        r = report
+        (r.motion_y, r.motion_x, r.motion_z, r.orientation_roll,
+         r.orientation_yaw, r.orientation_pitch) = NO_MOTION
+
+    def decode_sensors(self, buf, report):
+        r = report
+
+        # Acceleration
+        r.motion_y, r.motion_x, r.motion_z = \
+            S16LE_VECTOR.unpack_from(buf, self.accel)
+
+        # Orientation
+        roll, r.orientation_yaw, r.orientation_pitch = \
+            S16LE_VECTOR.unpack_from(buf, self.gyro)
+        # Negating -32768 would not fit the 16 bits of the other values
+        r.orientation_roll = min(-roll, 32767)
+
+
+# Values of the motion sensors when they are not decoded
+NO_MOTION = (0, 0, 0, 0, 0, 0)
+
+
+LazyGroup = namedtuple("LazyGroup", "flag fields decode")
+
+SENSOR_FIELDS = ("motion_y", "motion_x", "motion_z",
+                 "orientation_roll", "orientation_yaw", "orientation_pitch")
+
+# Values that are decoded on first access, grouped by the decoder
+# method that decodes them together
+LAZY_GROUPS = (
+    LazyGroup(1, ("trackpad_touch0_id", "trackpad_touch0_active",
+                  "trackpad_touch0_x", "trackpad_touch0_y",
+                  "trackpad_touch1_id", "trackpad_touch1_active",
+                  "trackpad_touch1_x", "trackpad_touch1_y"),
+              "decode_touchpad"),
+    LazyGroup(2, ("timestamp", "battery", "plug_usb", "plug_audio",
+                  "plug_mic"),
+              "decode_status"),
+    LazyGroup(4, SENSOR_FIELDS, "decode_motion"),
+)
+
+LAZY_FIELDS = dict((name, group) for group in LAZY_GROUPS
+                   for name in group.fields)
+
+
+class ReportFilter(object):
+    """Skips reports with the same input values as the previous one.
+
+    A report is still let through when the last one was delivered more
+    than heartbeat seconds ago, so consumers get a minimum report rate.
+    """
+
+    def __init__(self, decoder, heartbeat):
+        self.decoder = decoder
+        self.heartbeat = heartbeat
+        self.last_state = None
+        self.last_delivery = 0
+
+        self.skipped = 0
+        self.delivered = 0
+
+    def changed(self, buf, force=False):
+        """Returns True if the report in buf should be delivered.
+
+        With force the report is always delivered, and remembered as the
+        last one.
+        """
+        state = self.decoder.input_state(buf)
+        now = monotonic()
+
+        if (not force and state == self.last_state and
+            now - self.last_delivery < self.heartbeat):
+            self.skipped += 1
+            return False
+
+        self.last_state = state
+        self.last_delivery = now
+        self.delivered += 1
+
+        return True
+
+
+_decoders = {}
+
+
+def get_decoder(controller, offset=0, sensors=False):
+    """Returns the shared decoder for a controller type and offset."""
+    key = (controller, offset, sensors)
+    decoder = _decoders.get(key)
+    if not decoder:
+        decoder = _decoders[key] = ReportDecoder(controller.value, offset,
+                                                 sensors)
+
+    return decoder
+
+
+# Upper bound of reports read in one go, so that a device flooding us
+# can't starve the rest of the event loop
+MAX_DRAINED_REPORTS = 64
+
+
 def hashcrc32(report_id, pkt: bytearray):
     """Add a crc32 hash to the given report
     """
@@ -84,11 +507,22 @@ class DSDevice(object):
     Used to control the device functions and reading HID reports.
     """
 
+    # Size of the transport's input reports and where the input report
+    # data starts in them
+    report_size = 0
+    report_offset = 0
+
     def __init__(self, device_name, device_addr, type, controller):
         self.device_name = device_name
         self.device_addr = device_addr
         self.type = type
         self.controller = controller
+        self.decoder = get_decoder(controller, self.report_offset)
+        self.reports = ReportPool(buffer_size=self.report_size)
+        self.spare_buffer = bytearray(self.report_size)
+        self.report_filter = None
+        self.coalesced_reports = 0
+        self.clock = None
 
         self._led = (0, 0, 0)
         self._led_flash = (0, 0)
@@ -164,87 +598,154 @@ class DSDevice(object):
         self.write_report(report_id, pkt)
 
     def parse_report(self, buf):
-        """Parse a buffer containing a HID report."""
-
-        dpad = buf[self.controller.value.dpadByte] % 16
-
-        return DSReport(
-            # Left analog stick
-            buf[self.controller.value.lstick_start], buf[self.controller.value.lstick_start+1],
-
-            # Right analog stick
-            buf[self.controller.value.rstick_start], buf[self.controller.value.rstick_start+1],
-
-            # L2 and R2 analog
-            buf[self.controller.value.l2_analog], buf[self.controller.value.r2_analog],
-
-            # DPad up, down, left, right
-            (dpad in (0, 1, 7)), (dpad in (3, 4, 5)),
-            (dpad in (5, 6, 7)), (dpad in (1, 2, 3)),
-
-            # Buttons cross, circle, square, triangle
-            (buf[self.controller.value.symbols] &
-             32) != 0, (buf[self.controller.value.symbols] & 64) != 0,
-            (buf[self.controller.value.symbols] &
-             16) != 0, (buf[self.controller.value.symbols] & 128) != 0,
-
-            # L1, L2 and L3 buttons
-            (buf[self.controller.value.rl_digital] & 1) != 0, (buf[self.controller.value.rl_digital]
-                                                               & 4) != 0, (buf[self.controller.value.rl_digital] & 64) != 0,
-
-            # R1, R2,and R3 buttons
-            (buf[self.controller.value.rl_digital] & 2) != 0, (buf[self.controller.value.rl_digital]
-                                                               & 8) != 0, (buf[self.controller.value.rl_digital] & 128) != 0,
-
-            # Share/Create and option buttons
-            (buf[self.controller.value.rl_digital] &
-             16) != 0, (buf[self.controller.value.rl_digital] & 32) != 0,
-
-            # Trackpad and PS buttons
-            (buf[self.controller.value.trackpadps] &
-             2) != 0, (buf[self.controller.value.trackpadps] & 1) != 0,
-
-            # TODO: disable sensors on a config parameter instead of commenting out
-            # # Acceleration
-            # S16LE.unpack_from(buf, self.controller.value.accel_start)[0],
-            # S16LE.unpack_from(buf, self.controller.value.accel_start+2)[0],
-            # S16LE.unpack_from(buf, self.controller.value.accel_start+4)[0],
-
-            # # Orientation
-            # -(S16LE.unpack_from(buf, self.controller.value.gyro_start)[0]),
-            # S16LE.unpack_from(buf, self.controller.value.gyro_start+2)[0],
-            # S16LE.unpack_from(buf, self.controller.value.gyro_start+4)[0],
-
-            # Trackpad touch 1: id, active, x, y
-            buf[self.controller.value.touchpad_start] & 0x7f, (
-                buf[self.controller.value.touchpad_start] >> 7) == 0,
-            ((buf[self.controller.value.touchpad_start+2] & 0x0f)
-             << 8) | buf[self.controller.value.touchpad_start+1],
-            buf[self.controller.value.touchpad_start + \
-                3] << 4 | ((buf[self.controller.value.touchpad_start+2] & 0xf0) >> 4),
-
-            # Trackpad touch 2: id, active, x, y
-            buf[self.controller.value.touchpad_start + \
-                3] & 0x7f, (buf[self.controller.value.touchpad_start+3] >> 7) == 0,
-            ((buf[self.controller.value.touchpad_start+5] & 0x0f)
-             << 8) | buf[self.controller.value.touchpad_start+4],
-            buf[self.controller.value.touchpad_start + \
-                6] << 4 | ((buf[self.controller.value.touchpad_start+5] & 0xf0) >> 4),
-
-            # Timestamp and battery
-            buf[self.controller.value.trackpadps] >> 2,
-            buf[self.controller.value.batt_and_in] % 16,
-
-            # External inputs (usb, audio, mic)
-            (buf[self.controller.value.batt_and_in] &
-             16) != 0, (buf[self.controller.value.batt_and_in] & 32) != 0,
-            (buf[self.controller.value.batt_and_in] & 64) != 0
-        )
-
-    def read_report(self):
-        """Read and parse a HID report."""
+        """Parse a buffer containing a HID report.
+
+        The returned report is recycled by later calls, see
+        DSReport.retain(). To avoid copying buf should be the buffer
+        returned by self.reports.buffer().
+        """
+        if self.clock:
+            self.clock.update(buf[self.decoder.trackpadps] >> 2, monotonic())
+
+        return self.decoder.decode_into(buf, self.reports.next())
+
+    def sync_clock(self):
+        """Starts mapping the report counter to the host clock.
+
+        Returns the DeviceClock, see DeviceClock.time() to get the time
+        of a report.
+        """
+        if not self.clock:
+            self.clock = DeviceClock()
+
+        return self.clock
+
+    def set_sensors(self, enabled):
+        """Enables or disables decoding of the motion sensors."""
+        if enabled != self.decoder.sensors:
+            self.decoder = get_decoder(self.controller, self.report_offset,
+                                       enabled)
+
+            if self.report_filter:
+                self.report_filter.decoder = self.decoder
+
+    def skip_unchanged_reports(self, heartbeat):
+        """Stops delivering reports whose input values have not changed.
+
+        At least one report is delivered every heartbeat seconds.
+        """
+        self.report_filter = ReportFilter(self.decoder, heartbeat)
+
+    def read_reports(self, latest=False):
+        """Reads all the reports that are waiting to be read.
+
+        Yields every report, or with latest only the newest one. Button
+        presses and releases that happened in the skipped reports are
+        merged into the newest report, or delivered in an extra copy of
+        it when it can't show them. Yields None on disconnection.
+        """
+        if latest:
+            for report in self._read_latest_report():
+                yield report
+
+            return
+
+        for i in range(MAX_DRAINED_REPORTS):
+            buf = self.reports.buffer()
+
+            try:
+                size = self.read_raw(buf)
+            except IOError:
+                yield None
+                return
+
+            if size is None:
+                return
+
+            if size == 0:
+                yield None
+                return
+
+            if not self.valid_report(buf, size):
+                continue
+
+            if self.report_filter and not self.report_filter.changed(buf):
+                continue
+
+            yield self.parse_report(buf)
+
+    def _read_latest_report(self):
+        # Replaces the next report first if it was retained
+        self.reports.buffer()
+
+        previous = mask = self.reports.latest.button_mask
+        pressed = released = 0
+        count = 0
+
+        for i in range(MAX_DRAINED_REPORTS):
+            spare = self.spare_buffer
+
+            try:
+                size = self.read_raw(spare)
+            except IOError:
+                yield None
+                return
+
+            if size is None:
+                break
+
+            if size == 0:
+                yield None
+                return
+
+            if not self.valid_report(spare, size):
+                continue
+
+            buf, self.spare_buffer = spare, self.reports.swap_buffer(spare)
+            count += 1
+
+            new_mask = self.decoder.button_mask(buf)
+            pressed |= new_mask & ~mask
+            released |= mask & ~new_mask
+            mask = new_mask
+
+        if not count:
+            return
+
+        self.coalesced_reports += count - 1
+
+        # Pressed and released again, or released and pressed again
+        missed_presses = pressed & ~mask
+        missed_releases = released & mask & previous
+
+        if (self.report_filter and not self.report_filter.changed(
+                buf, force=bool(missed_presses or missed_releases))):
+            return
+
+        report = self.parse_report(buf)
+
+        if missed_releases:
+            released_report = report.snapshot()
+            set_buttons(released_report, missed_releases, False)
+            yield released_report
+
+        if missed_presses:
+            set_buttons(report, missed_presses, True)
+
+        yield report
+
+    def read_raw(self, buf):
+        """Reads a report into buf without blocking.
+
+        Returns the size of the report, 0 on disconnection and None if
+        there was nothing to read.
+        """
         pass
 
+    def valid_report(self, buf, size):
+        """Checks the size and id of a report read by read_raw()."""
+        return True
+
     def write_report(self, report_id, data):
         """Writes a HID report to the control channel."""
         pass
@@ -1,50 +1,89 @@
 import os
 
-from collections import defaultdict, deque
-from functools import wraps
-from select import epoll, EPOLLIN
+from heapq import heappop, heappush
+from itertools import count
+from math import ceil
+from select import epoll, EPOLLIN, EPOLLOUT
+from threading import Lock
+from time import monotonic
 
 from .packages import timerfd
-from .utils import iter_except
+
+# Timer deadlines are rounded up to this many seconds, timers that expire
+# within the same tick are run together on one wakeup.
+TIMER_TICK = 0.001
 
 
 class Timer(object):
-    """Simple interface around a timerfd connected to a event loop."""
+    """A repeating timer run by a event loop.
+
+    All the timers of a loop share a single timerfd, see
+    EventLoop.schedule_timer().
+    """
 
     def __init__(self, loop, interval, callback):
         self.callback = callback
         self.interval = interval
+        self.ticks = max(int(round(interval / TIMER_TICK)), 1)
         self.loop = loop
-        self.timer = timerfd.create(timerfd.CLOCK_MONOTONIC)
+
+        self.args = ()
+        self.kwargs = {}
+
+        # Sequence number of the timer's entry in the loop's timer queue,
+        # None when it's not scheduled.
+        self.seq = None
+
+        # Number of expirations that were missed because the loop was
+        # busy, the callback is only called once for them.
+        self.overruns = 0
 
     def start(self, *args, **kwargs):
         """Starts the timer.
 
         If the callback returns True the timer will be restarted.
         """
+        self.args = args
+        self.kwargs = kwargs
 
-        @wraps(self.callback)
-        def callback():
-            os.read(self.timer, 8)
-            repeat = self.callback(*args, **kwargs)
-            if not repeat:
-                self.stop()
-
-        spec = timerfd.itimerspec(self.interval, self.interval)
-        timerfd.settime(self.timer, 0, spec)
-
-        self.loop.remove_watcher(self.timer)
-        self.loop.add_watcher(self.timer, callback)
+        now = int(ceil(monotonic() / TIMER_TICK))
+        self.loop.schedule_timer(self, now + self.ticks)
 
     def stop(self):
         """Stops the timer if it's running."""
-        self.loop.remove_watcher(self.timer)
+        self.loop.cancel_timer(self)
+
+    @property
+    def active(self):
+        """True while the timer is scheduled to expire."""
+        return self.seq is not None
+
+    def expire(self, deadline, now):
+        """Runs the callback, called by the loop when the timer expires."""
+        missed = (now - deadline) // self.ticks
+        self.overruns += missed
+
+        repeat = self.callback(*self.args, **self.kwargs)
+        if not repeat:
+            self.stop()
+        elif self.seq is None:
+            # Keep the original phase, skipping the missed expirations
+            self.loop.schedule_timer(self, deadline +
+                                     (missed + 1) * self.ticks)
 
 
 class EventLoop(object):
     """Basic IO, event and timer loop with callbacks."""
 
     def __init__(self):
+        self.timer_fd = timerfd.create(timerfd.CLOCK_MONOTONIC,
+                                       timerfd.NONBLOCK | timerfd.CLOEXEC)
+        self.timer_lock = Lock()
+        self.timer_seq = count()
+
+        # Number of times the timerfd has expired
+        self.timer_expirations = 0
+
         self.stop()
 
         # Timeout value well over the expected controller poll time, but
@@ -56,6 +95,68 @@ class EventLoop(object):
 
         return Timer(self, interval, callback)
 
+    def schedule_timer(self, timer, deadline):
+        """Schedules a timer to expire at deadline.
+
+        The deadline is a CLOCK_MONOTONIC time in ticks. Replaces any
+        earlier schedule of the timer.
+        """
+        with self.timer_lock:
+            timer.seq = seq = next(self.timer_seq)
+            heappush(self.timers, (deadline, seq, timer))
+
+            if self.timer_deadline is None or deadline < self.timer_deadline:
+                self._arm_timer()
+
+    def cancel_timer(self, timer):
+        """Unschedules a timer.
+
+        Its entry is left in the queue and skipped when it's reached.
+        """
+        timer.seq = None
+
+    def _arm_timer(self):
+        # Drop cancelled timers from the top so they don't cause wakeups
+        while self.timers and self.timers[0][2].seq != self.timers[0][1]:
+            heappop(self.timers)
+
+        if self.timers:
+            deadline = self.timers[0][0]
+            spec = timerfd.itimerspec(0, deadline * TIMER_TICK)
+        else:
+            deadline = None
+            spec = timerfd.itimerspec(0, 0)
+
+        if deadline != self.timer_deadline:
+            timerfd.settime(self.timer_fd, timerfd.TIMER_ABSTIME, spec)
+            self.timer_deadline = deadline
+
+    def process_timers(self):
+        """Runs all the timers that have expired."""
+        try:
+            buf = os.read(self.timer_fd, timerfd.bufsize)
+            self.timer_expirations += timerfd.unpack(buf)
+        except OSError:
+            pass
+
+        # Rounded, as the timerfd may expire a hair before the tick
+        now = int(monotonic() / TIMER_TICK + 0.5)
+        expired = []
+
+        with self.timer_lock:
+            while self.timers and self.timers[0][0] <= now:
+                deadline, seq, timer = heappop(self.timers)
+                if timer.seq == seq:
+                    timer.seq = None
+                    expired.append((deadline, timer))
+
+        for deadline, timer in expired:
+            timer.expire(deadline, now)
+
+        with self.timer_lock:
+            self.timer_deadline = None
+            self._arm_timer()
+
     def add_watcher(self, fd, callback):
         """Starts watching a non-blocking fd for data."""
 
@@ -74,32 +175,68 @@ class EventLoop(object):
             return
 
         self.callbacks.pop(fd, None)
+        self.write_callbacks.pop(fd, None)
         self.epoll.unregister(fd)
 
+    def watch_writable(self, fd, callback):
+        """Calls callback whenever a watched fd can be written to.
+
+        Used to flush data that could not be written right away, call
+        unwatch_writable() once there is nothing left to write.
+        """
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+
+        if fd not in self.write_callbacks:
+            self.epoll.modify(fd, EPOLLIN | EPOLLOUT)
+
+        self.write_callbacks[fd] = callback
+
+    def unwatch_writable(self, fd):
+        """Stops calling the write callback of a fd."""
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+
+        if self.write_callbacks.pop(fd, None):
+            self.epoll.modify(fd, EPOLLIN)
+
     def register_event(self, event, callback):
-        """Registers a handler for an event."""
-        self.event_callbacks[event].add(callback)
+        """Registers a handler for an event.
+
+        Handlers are called in the order they were registered.
+        """
+        callbacks = self.event_callbacks.get(event, ())
+        if callback not in callbacks:
+            self.event_callbacks[event] = callbacks + (callback,)
 
     def unregister_event(self, event, callback):
         """Unregisters a event handler."""
-        self.event_callbacks[event].remove(callback)
+        callbacks = list(self.event_callbacks[event])
+        callbacks.remove(callback)
+        self.event_callbacks[event] = tuple(callbacks)
 
-    def fire_event(self, event, *args, **kwargs):
-        """Fires a event."""
-        self.event_queue.append((event, args))
-        self.process_events()
+    def fire_event(self, event, *args):
+        """Fires a event.
 
-    def process_events(self):
-        """Processes any events in the queue."""
-        for event, args in iter_except(self.event_queue.popleft, IndexError):
-            for callback in self.event_callbacks[event]:
-                callback(*args)
+        The handlers are called right away, a event fired by a handler
+        is handled before the remaining handlers of the current one.
+        """
+        for callback in self.event_callbacks.get(event, ()):
+            callback(*args)
 
     def run(self):
         """Starts the loop."""
         self.running = True
         while self.running:
             for fd, event in self.epoll.poll(self.epoll_timeout):
+                if event & EPOLLOUT:
+                    callback = self.write_callbacks.get(fd)
+                    if callback:
+                        callback()
+
+                    if event == EPOLLOUT:
+                        continue
+
                 callback = self.callbacks.get(fd)
                 if callback:
                     callback()
@@ -108,8 +245,83 @@ class EventLoop(object):
         """Stops the loop."""
         self.running = False
         self.callbacks = {}
+        self.write_callbacks = {}
         self.epoll = epoll()
 
-        self.event_queue = deque()
-        self.event_callbacks = defaultdict(set)
+        self.event_callbacks = {}
+
+        with self.timer_lock:
+            self.timers = []
+            self.timer_deadline = None
+            timerfd.settime(self.timer_fd, 0, timerfd.itimerspec(0, 0))
+
+        self.add_watcher(self.timer_fd, self.process_timers)
+
+    def scope(self):
+        """Creates a view of the loop with its own events."""
+        return ScopedEventLoop(self)
+
+
+class ScopedEventLoop(EventLoop):
+    """A part of a shared EventLoop.
+
+    Watchers and timers are added to the shared loop, but events are
+    only delivered to handlers registered on the same scope. Stopping
+    the scope removes its watchers and timers while the shared loop
+    keeps running.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.fds = set()
+        self.timers = set()
+        self.stop()
+
+        self.running = True
+
+    def schedule_timer(self, timer, deadline):
+        self.loop.schedule_timer(timer, deadline)
+        self.timers.add(timer)
+
+    def cancel_timer(self, timer):
+        self.loop.cancel_timer(timer)
+        self.timers.discard(timer)
+
+    def add_watcher(self, fd, callback):
+        """Starts watching a non-blocking fd for data."""
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+
+        self.loop.add_watcher(fd, callback)
+        self.fds.add(fd)
+
+    def remove_watcher(self, fd):
+        """Stops watching a fd."""
+        if not isinstance(fd, int):
+            fd = fd.fileno()
+
+        self.loop.remove_watcher(fd)
+        self.fds.discard(fd)
+
+    def watch_writable(self, fd, callback):
+        self.loop.watch_writable(fd, callback)
+
+    def unwatch_writable(self, fd):
+        self.loop.unwatch_writable(fd)
+
+    def run(self):
+        """The shared loop is run by its owner."""
+        pass
+
+    def stop(self):
+        """Removes all the watchers, timers and event handlers of the
+        scope."""
+        self.running = False
+
+        for fd in list(self.fds):
+            self.remove_watcher(fd)
+
+        for timer in list(self.timers):
+            self.cancel_timer(timer)
 
+        self.event_callbacks = {}
@@ -0,0 +1,153 @@
+"""Runs blocking binding actions off the event loops.
+
+An ActionExecutor is a pool of worker threads shared by all controllers.
+Each controller submits its actions to its own ActionQueue, which runs
+them one at a time and in the order they were submitted, while the
+queues of different controllers run in parallel up to the number of
+workers. Submitting never blocks, when a queue is full the action is
+dropped.
+"""
+
+import queue
+
+from collections import deque
+from threading import Lock, Thread
+from time import monotonic
+
+
+class QueueStats(object):
+    """Metrics of an ActionQueue.
+
+    Wait is the time from submitting an action until a worker starts it,
+    run the time it took. Times are in seconds.
+    """
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    @property
+    def wait_mean(self):
+        return self.completed and self.wait_total / self.completed
+
+    @property
+    def run_mean(self):
+        return self.completed and self.run_total / self.completed
+
+
+class ActionQueue(object):
+    """The actions of a controller, run in order by an ActionExecutor."""
+
+    def __init__(self, executor, size, logger=None):
+        self.executor = executor
+        self.size = size
+        self.logger = logger
+        self.stats = QueueStats()
+
+        # Actions waiting to run, the first one is running or scheduled
+        # while scheduled is True
+        self.actions = deque()
+        self.scheduled = False
+        self.lock = Lock()
+
+    @property
+    def depth(self):
+        """Actions waiting or running."""
+        return len(self.actions)
+
+    def submit(self, func, *args):
+        """Queues func(*args), returns False if the queue was full."""
+        stats = self.stats
+        with self.lock:
+            if len(self.actions) >= self.size:
+                stats.dropped += 1
+                return False
+
+            self.actions.append((func, args, monotonic()))
+            stats.submitted += 1
+            stats.max_depth = max(stats.max_depth, len(self.actions))
+
+            if self.scheduled:
+                return True
+
+            self.scheduled = True
+
+        self.executor.schedule(self)
+        return True
+
+    def run_next(self):
+        """Runs the first action, called by a worker.
+
+        Actions report failures by raising, they are logged here and
+        counted in QueueStats.failed.
+        """
+        func, args, submitted = self.actions[0]
+        stats = self.stats
+
+        start = monotonic()
+        try:
+            func(*args)
+        except Exception as err:
+            stats.failed += 1
+            if self.logger:
+                self.logger.error("Failed to execute action: {0}", err)
+
+        end = monotonic()
+        wait, run = start - submitted, end - start
+
+        with self.lock:
+            self.actions.popleft()
+            stats.completed += 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            stats.run_total += run
+            stats.run_max = max(stats.run_max, run)
+
+            self.scheduled = bool(self.actions)
+
+        # The next action waits behind the queues of other controllers
+        if self.scheduled:
+            self.executor.schedule(self)
+
+
+class ActionExecutor(object):
+    """A pool of worker threads that run the actions of ActionQueues.
+
+    The threads are started when the first action is submitted.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.ready = queue.Queue()
+        self.threads = []
+        self.lock = Lock()
+
+    def create_queue(self, size=16, logger=None):
+        """Returns a new queue of actions that run in order."""
+        return ActionQueue(self, size, logger)
+
+    def schedule(self, action_queue):
+        self.start()
+        self.ready.put(action_queue)
+
+    def start(self):
+        if len(self.threads) >= self.workers:
+            return
+
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def _worker(self):
+        while True:
+            self.ready.get().run_next()
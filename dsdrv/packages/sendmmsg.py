@@ -0,0 +1,107 @@
+"""Sends one message to many IPv4 addresses with a single sendmmsg(2).
+
+available is False when the C library has no sendmmsg, callers should
+fall back to a sendto() per address then.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+
+__all__ = ["available", "MessageBatch"]
+
+
+class iovec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class mmsghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", msghdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+# struct sockaddr_in: family, port in network order, address and padding
+SOCKADDR_IN = struct.Struct("=H2s4s8x")
+
+
+def sockaddr_in(address):
+    host, port = address[:2]
+    return SOCKADDR_IN.pack(socket.AF_INET, struct.pack(">H", port),
+                            socket.inet_aton(host))
+
+
+def errcheck(result, func, arguments):
+    if result < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    return result
+
+
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(mmsghdr),
+                              ctypes.c_uint, ctypes.c_int]
+    libc.sendmmsg.errcheck = errcheck
+    available = True
+except (AttributeError, OSError):
+    available = False
+
+
+class MessageBatch(object):
+    """The messages needed to send a buffer to a fixed list of addresses.
+
+    The buffer must be a bytearray, it is referenced by the messages
+    until a different buffer is sent.
+    """
+
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.names = ctypes.create_string_buffer(
+            b"".join(sockaddr_in(address) for address in addresses))
+        self.iov = iovec()
+        self.messages = (mmsghdr * len(addresses))()
+        self.buf = None
+        self.data = None
+
+        names = ctypes.addressof(self.names)
+        for i, message in enumerate(self.messages):
+            message.msg_hdr.msg_name = names + i * SOCKADDR_IN.size
+            message.msg_hdr.msg_namelen = SOCKADDR_IN.size
+            message.msg_hdr.msg_iov = ctypes.pointer(self.iov)
+            message.msg_hdr.msg_iovlen = 1
+
+    def send(self, fd, buf, start=0):
+        """Sends buf to the addresses from start on.
+
+        Returns how many addresses it was sent to, which is less than
+        requested when the socket buffer filled up. Raises OSError if it
+        could not be sent to the first one.
+        """
+        if buf is not self.buf:
+            self.data = (ctypes.c_char * len(buf)).from_buffer(buf)
+            self.iov.iov_base = ctypes.addressof(self.data)
+            self.iov.iov_len = len(buf)
+            self.buf = buf
+
+        return libc.sendmmsg(fd, ctypes.byref(self.messages[start]),
+                             len(self.addresses) - start, 0)
@@ -0,0 +1,209 @@
+"""Response curves of the sticks and triggers.
+
+A Response is set per event in a mapping section and compiled into
+256-entry tables, one per event, indexed by the report value:
+
+    [mapping:example]
+    ABS_X = left_analog_x
+    ABS_X_deadzone = 8
+    ABS_X_radial_deadzone = 10
+    ABS_X_antideadzone = 12
+    ABS_X_curve = exponential:3
+
+Deadzones and the anti-deadzone are in report units, from the center
+of a stick (up to 127) or from the released position of a trigger (up
+to 255). Curves map the deflection after the deadzone, from 0 to 1, to
+the output deflection:
+
+    linear           the default
+    exponential[:k]  (e^(k x) - 1) / (e^k - 1), k defaults to 3
+    x:y,x:y,...      straight lines between points, 0:0 and 1:1 are
+                     added when left out
+"""
+
+from math import exp
+
+STICK_FIELDS = ("left_analog_x", "left_analog_y",
+                "right_analog_x", "right_analog_y")
+TRIGGER_FIELDS = ("l2_analog", "r2_analog")
+
+STICK_CENTER = 128
+DEFAULT_EXPONENT = 3.0
+
+# Squared distance of a stick value from the center
+SQUARES = tuple((value - STICK_CENTER) ** 2 for value in range(256))
+
+# Response options of a mapping section by key suffix, longest first
+OPTIONS = (("_RADIAL_DEADZONE", "radial_deadzone"),
+           ("_ANTIDEADZONE", "antideadzone"),
+           ("_DEADZONE", "deadzone"),
+           ("_CURVE", "curve"))
+
+
+def linear(x):
+    return x
+
+
+def exponential(k):
+    scale = exp(k) - 1
+    return lambda x: (exp(k * x) - 1) / scale
+
+
+def points(pairs):
+    """Returns a curve of straight lines between points."""
+    pairs = sorted(pairs)
+    if pairs[0][0] > 0:
+        pairs.insert(0, (0.0, 0.0))
+    if pairs[-1][0] < 1:
+        pairs.append((1.0, 1.0))
+
+    def curve(x):
+        for (x0, y0), (x1, y1) in zip(pairs, pairs[1:]):
+            if x <= x1:
+                return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+        return pairs[-1][1]
+
+    return curve
+
+
+def parse_curve(value):
+    """Parses the value of a curve option."""
+    name, _, arg = value.strip().lower().partition(":")
+
+    if name == "linear" and not arg:
+        return linear
+    elif name == "exponential":
+        k = float(arg) if arg else DEFAULT_EXPONENT
+        if k <= 0:
+            raise ValueError("Exponent must be positive: {0}".format(value))
+
+        return exponential(k)
+
+    try:
+        pairs = [tuple(map(float, point.split(":")))
+                 for point in value.split(",")]
+    except ValueError:
+        raise ValueError("Invalid curve: {0}".format(value))
+
+    if any(len(pair) != 2 or not 0 <= pair[0] <= 1 for pair in pairs):
+        raise ValueError("Invalid curve points: {0}".format(value))
+
+    if len(set(x for x, y in pairs)) != len(pairs):
+        raise ValueError("Duplicate curve points: {0}".format(value))
+
+    return points(pairs)
+
+
+def partner_axis(attr):
+    """The other axis of a stick."""
+    return attr[:-1] + ("y" if attr.endswith("x") else "x")
+
+
+class Response(object):
+    """How the deflection of a stick or trigger is passed on.
+
+    deadzone is None when not set, so that analog buttons and the mouse
+    can use their own default.
+    """
+
+    def __init__(self, deadzone=None, radial_deadzone=0, antideadzone=0,
+                 curve=None):
+        self.deadzone = deadzone
+        self.radial_deadzone = radial_deadzone
+        self.antideadzone = antideadzone
+        self.curve = curve
+
+    def set_option(self, name, value):
+        """Sets an option from its string value in a mapping section."""
+        if name == "curve":
+            self.curve = parse_curve(value)
+            return
+
+        number = int(value)
+        if number < 0:
+            raise ValueError("{0} must not be negative: {1}".format(name,
+                                                                    value))
+
+        setattr(self, name, number)
+
+    def check(self, attr):
+        """Raises ValueError if the response can't be used for attr."""
+        if attr not in STICK_FIELDS + TRIGGER_FIELDS:
+            raise ValueError("Response curves only apply to sticks and "
+                             "triggers, not {0}".format(attr))
+
+        if self.radial_deadzone and attr not in STICK_FIELDS:
+            raise ValueError("Radial deadzones only apply to sticks, "
+                             "not {0}".format(attr))
+
+    def magnitude(self, value, full, deadzone=None):
+        """Output deflection, from 0 to 1, of a deflection value out of
+        full in report units."""
+        if deadzone is None:
+            deadzone = self.deadzone or 0
+
+        if value <= deadzone or deadzone >= full:
+            return 0.0
+
+        x = min((value - deadzone) / (full - deadzone), 1.0)
+        y = (self.curve or linear)(x)
+        anti = min(self.antideadzone / full, 1.0)
+
+        return anti + (1.0 - anti) * y
+
+    def deflections(self, deadzone=None):
+        """The signed output deflection of every value of a stick."""
+        table = []
+        for value in range(256):
+            offset = value - STICK_CENTER
+            full = 127 if offset > 0 else 128
+            magnitude = self.magnitude(abs(offset), full, deadzone)
+            table.append(magnitude if offset >= 0 else -magnitude)
+
+        return table
+
+    def axis_table(self, attr, minimum, maximum):
+        """Axis values, between minimum and maximum, by report value."""
+        if attr in TRIGGER_FIELDS:
+            return tuple(int(round(minimum + (maximum - minimum) *
+                                   self.magnitude(value, 255)))
+                         for value in range(256))
+
+        center = (minimum + maximum) / 2
+        half = (maximum - minimum) / 2
+        return tuple(max(minimum, min(maximum,
+                                      int(round(center + half * deflection))))
+                     for deflection in self.deflections())
+
+    def mouse_table(self, modifier, sensitivity, deadzone):
+        """Mouse movement per update by stick value.
+
+        Without a curve or anti-deadzone a stick moves the mouse by a
+        tenth of its offset from the center, like it always did.
+        """
+        if self.deadzone is not None:
+            deadzone = self.deadzone
+
+        sign = -sensitivity if modifier == "-" else sensitivity
+        if self.curve is None and not self.antideadzone:
+            return tuple((value - STICK_CENTER) / 10 * sign
+                         if abs(value - STICK_CENTER) > deadzone else 0
+                         for value in range(256))
+
+        return tuple(deflection * 127 / 10 * sign
+                     for deflection in self.deflections(deadzone))
+
+
+# Used when a mapping sets no response for an event
+DEFAULT_RESPONSE = Response()
+
+
+def parse_response_option(key):
+    """Splits a mapping key into its event and response option.
+
+    Returns None for keys that are not response options.
+    """
+    for suffix, name in OPTIONS:
+        if key.endswith(suffix) and len(key) > len(suffix):
+            return key[:-len(suffix)], name
@@ -1 +1,2 @@
 from .udp import UDPServer
+from .unix import UnixServer
@@ -1,12 +1,16 @@
 from __future__ import division
 from builtins import bytes
 
+from collections import defaultdict, deque
 from threading import Thread
+import select
 import sys
 import socket
 import struct
 from binascii import crc32
-from time import time
+from time import monotonic, time
+
+from ..packages import sendmmsg
 
 
 class Message(list):
@@ -37,8 +41,151 @@ class Message(list):
         self[8:12] = bytes(struct.pack('<I', crc))
 
 
+# Header: magic, protocol version, length, CRC32, server ID, message type
+HEADER = struct.Struct('<4sHHIII')
+# Slot info: pad id, state, gyro, connection type, MAC, battery
+SLOT_INFO = struct.Struct('<4B6sB')
+# Data after the slot info and active flag: packet counter, buttons,
+# sticks, analog buttons, touches and timestamp
+DATA = struct.Struct('<I20B2B2H2B2HQ')
+# Accelerometer and gyroscope at the end of the data
+MOTION = struct.Struct('<6f')
+
+SLOT_INFO_OFFSET = HEADER.size
+DATA_OFFSET = SLOT_INFO_OFFSET + SLOT_INFO.size + 1
+MOTION_OFFSET = DATA_OFFSET + DATA.size
+DATA_PACKET_SIZE = MOTION_OFFSET + MOTION.size
+CRC = struct.Struct('<I')
+
+NO_CRC = bytes(4)
+NO_MAC = bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0xff])  # 00:00:00:00:00:FF
+NO_TOUCH = (0, 0, 0, 0, 0, 0, 0, 0)
+NO_MOTION = MOTION.pack(0, 0, 0, 0, 0, 0)
+
+# Seconds without a data request before a client is dropped, and how
+# often to look for such clients
+CLIENT_TIMEOUT = 5
+SWEEP_INTERVAL = 1.0
+
+
+def button_table(size, func):
+    """Precomputes func for every value of a group of button bits."""
+    return tuple(func(lambda bit: (value >> bit) & 1) for value in range(size))
+
+
+# Values sent for the bits of DSReport.button_mask, looked up per group
+# of buttons. Dpad: buttons1 bits, left, down, right and up
+DPAD_VALUES = button_table(16, lambda b: (
+    b(0) << 4 | b(3) << 5 | b(1) << 6 | b(2) << 7,
+    b(2) * 0xFF, b(1) * 0xFF, b(3) * 0xFF, b(0) * 0xFF))
+# Symbols: buttons2 bits, square, cross, circle and triangle
+SYMBOLS_VALUES = button_table(16, lambda b: (
+    b(3) << 4 | b(1) << 5 | b(0) << 6 | b(2) << 7,
+    b(2) * 0xFF, b(0) * 0xFF, b(1) * 0xFF, b(3) * 0xFF))
+REMAPPED_SYMBOLS_VALUES = button_table(16, lambda b: (
+    b(3) << 7 | b(1) << 6 | b(0) << 5 | b(2) << 4,
+    b(2) * 0xFF, b(0) * 0xFF, b(1) * 0xFF, b(3) * 0xFF))
+# Shoulder: buttons1 bits, buttons2 bits, r1 and l1
+SHOULDER_VALUES = button_table(256, lambda b: (
+    b(6) | b(2) << 1 | b(5) << 2 | b(7) << 3,
+    b(1) | b(4) << 1 | b(0) << 2 | b(3) << 3,
+    b(3) * 0xFF, b(0) * 0xFF))
+# Trackpad and PS: PS and trackpad
+TRACKPADPS_VALUES = button_table(4, lambda b: (b(1) * 0xFF, b(0) * 0xFF))
+
+
+class DataPacket(object):
+    """A preallocated data message, reused for every report of a slot.
+
+    The header and slot info are only written when the controller
+    changes, a report fills in the rest of the packet in place. Without
+    sensors the motion stays zero and is not written by reports.
+    """
+
+    def __init__(self):
+        self.buf = bytearray(DATA_PACKET_SIZE)
+        self.counter = 0
+        self.device = None
+        self.sensors = None
+        self.clock = None
+
+        HEADER.pack_into(self.buf, 0, b'DSUS', 1001, DATA_PACKET_SIZE - 16,
+                         0, 0xffffffff, 0x100002)
+        self.buf[DATA_OFFSET - 1] = 0x01  # is active (true)
+
+    def set_slot_info(self, slot_info, device, sensors):
+        self.buf[SLOT_INFO_OFFSET:SLOT_INFO_OFFSET + SLOT_INFO.size] = \
+            slot_info
+        self.device = device
+        self.sensors = sensors
+
+        if not sensors:
+            self.buf[MOTION_OFFSET:DATA_PACKET_SIZE] = NO_MOTION
+
+    def fill(self, report, remap=False, send_touch=True, timestamp=None):
+        """Writes report into the packet and returns the packet.
+
+        timestamp is the time of the report in seconds, defaults to now.
+        """
+        mask = report.button_mask
+        dpad = DPAD_VALUES[mask & 0xF]
+        symbols = (REMAPPED_SYMBOLS_VALUES if remap
+                   else SYMBOLS_VALUES)[(mask >> 4) & 0xF]
+        shoulder = SHOULDER_VALUES[(mask >> 8) & 0xFF]
+        ps, trackpad = TRACKPADPS_VALUES[mask >> 16]
+
+        if send_touch:
+            touch = (report.trackpad_touch0_active,
+                     report.trackpad_touch0_id,
+                     report.trackpad_touch0_x, report.trackpad_touch0_y,
+                     report.trackpad_touch1_active,
+                     report.trackpad_touch1_id,
+                     report.trackpad_touch1_x, report.trackpad_touch1_y)
+        else:
+            touch = NO_TOUCH
+
+        buf = self.buf
+        DATA.pack_into(
+            buf, DATA_OFFSET, self.counter,
+            dpad[0] | shoulder[0], symbols[0] | shoulder[1], ps, trackpad,
+
+            report.left_analog_x,
+            255 - report.left_analog_y,
+            report.right_analog_x,
+            255 - report.right_analog_y,
+
+            dpad[1], dpad[2], dpad[3], dpad[4],
+            symbols[1], symbols[2], symbols[3], symbols[4],
+            shoulder[2], shoulder[3],
+
+            report.r2_analog,
+            report.l2_analog,
+
+            *touch,
+
+            int((time() if timestamp is None else timestamp) * 10**6))
+
+        if self.sensors:
+            MOTION.pack_into(
+                buf, MOTION_OFFSET,
+                report.orientation_roll / 8192,
+                - report.orientation_yaw / 8192,
+                - report.orientation_pitch / 8192,
+                report.motion_y / 16,
+                - report.motion_x / 16,
+                - report.motion_z / 16)
+
+        self.counter = (self.counter + 1) & 0xffffffff
+
+        buf[8:12] = NO_CRC
+        CRC.pack_into(buf, 8, crc32(buf) & 0xffffffff)
+
+        return buf
+
+
 class Registration:
-    def __init__(self, mode=0, slot=None, mac=None):
+    def __init__(self, address, mode=0, slot=None, mac=None):
+        self.address = address
         self.mode = mode
         self.slot = slot
 
@@ -49,12 +196,8 @@ class Registration:
 
         self.refresh()
 
-    @property
-    def timed_out(self):
-        return time() - self.ts > 5
-
     def refresh(self):
-        self.ts = time()
+        self.ts = monotonic()
 
     @property
     def mode_str(self):
@@ -67,42 +210,263 @@ class Registration:
         else:
             return 'unknown'
 
-    def match(self, index, controller):
-        if self.mode == 0:
-            return True
 
-        if self.mode == 1 and index == self.slot:
-            return True
+class Subscribers(object):
+    """The registrations of the clients, indexed by slot and by MAC.
+
+    A client has a registration for each slot or MAC it requests data
+    for. Changes replace the index instead of modifying it, so reports
+    can look up their recipients while clients are added from another
+    thread.
+    """
+
+    def __init__(self):
+        self.registrations = {}
+        self._build_index()
 
-        if self.mode == 2 and controller.device.device_addr == self.mac:
-            return True
+    def __len__(self):
+        return len(self.registrations)
 
-        return False
+    def subscribe(self, address, mode, slot, mac):
+        """Adds or refreshes a registration, returns it if it is new."""
+        key = (address, mode,
+               slot if mode == 1 else None,
+               bytes(mac) if mode == 2 else None)
+
+        registration = self.registrations.get(key)
+        if registration:
+            registration.refresh()
+            return
+
+        registrations = dict(self.registrations)
+        registrations[key] = registration = Registration(address, mode,
+                                                         slot, mac)
+        self.registrations = registrations
+        self._build_index()
+
+        return registration
+
+    def expire(self):
+        """Removes the timed out registrations and returns them."""
+        deadline = monotonic() - CLIENT_TIMEOUT
+        expired = [key for key, registration in self.registrations.items()
+                   if registration.ts < deadline]
+
+        if not expired:
+            return []
+
+        registrations = dict(self.registrations)
+        expired = [registrations.pop(key) for key in expired]
+        self.registrations = registrations
+        self._build_index()
+
+        return expired
+
+    def _build_index(self):
+        everyone = []
+        slots = defaultdict(list)
+        macs = defaultdict(list)
+
+        for registration in self.registrations.values():
+            if registration.mode == 0:
+                everyone.append(registration.address)
+            elif registration.mode == 1:
+                slots[registration.slot].append(registration.address)
+            elif registration.mode == 2:
+                macs[registration.mac].append(registration.address)
+
+        self.index = (tuple(everyone),
+                      dict((slot, tuple(a)) for slot, a in slots.items()),
+                      dict((mac, tuple(a)) for mac, a in macs.items()),
+                      {})
+
+    def recipients(self, index, mac):
+        """Returns the addresses subscribed to a slot and its MAC.
+
+        The addresses are returned along with a sendmmsg batch for them,
+        or None when there is only one or sendmmsg is not available.
+        """
+        everyone, slots, macs, cache = self.index
+
+        recipients = cache.get((index, mac))
+        if recipients is None:
+            # Each address only once, even with several registrations
+            addresses = tuple(dict.fromkeys(
+                everyone + slots.get(index, ()) + macs.get(mac, ())))
+
+            batch = None
+            if sendmmsg.available and len(addresses) > 1:
+                batch = sendmmsg.MessageBatch(addresses)
+
+            recipients = cache[(index, mac)] = (addresses, batch)
+
+        return recipients
+
+
+class RateLimiter(object):
+    """Picks the reports of a slot that are sent to its clients.
+
+    A report is sent when the send interval has passed since the last
+    one, or right away when its buttons changed. Otherwise it is held
+    back and sent at the end of the interval, unless a newer report
+    replaces it first. While the input values stay the same only the
+    idle interval applies, which keeps the clients from timing out.
+    """
+
+    def __init__(self, loop, send, interval=0, idle_interval=0):
+        self.loop = loop
+        self.send = send
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.last_send = 0
+        self.buttons = None
+        self.state = None
+        self.pending = None
+        self.timer = None
+
+    def input_state(self, report):
+        if self.idle_interval and report.decoder:
+            return report.decoder.input_state(report.raw)
+
+    def submit(self, report):
+        """Returns True if report should be sent now."""
+        now = monotonic()
+        state = self.input_state(report)
+
+        if report.button_mask == self.buttons:
+            if state is not None and state == self.state:
+                # The clients already have this state
+                self.pending = None
+                if now - self.last_send < self.idle_interval:
+                    return False
+
+            elif now - self.last_send < self.interval:
+                self.pending = report
+                if not self.timer:
+                    self.schedule(now)
+
+                return False
+
+        self.sent(report, now, state)
+        return True
+
+    def sent(self, report, now, state):
+        self.last_send = now
+        self.buttons = report.button_mask
+        self.state = state
+        self.pending = None
+
+    def schedule(self, now):
+        self.timer = self.loop.create_timer(
+            self.last_send + self.interval - now, self.flush)
+        self.timer.start()
+
+    def reset(self):
+        """Drops the held back report and forgets the last one sent,
+        e.g. when the device disconnects."""
+        if self.timer:
+            self.timer.stop()
+            self.timer = None
+
+        self.pending = None
+        self.buttons = None
+        self.state = None
+        self.last_send = 0
+
+    def flush(self):
+        # The pending report is the latest of its device, which the
+        # report pool doesn't recycle until a newer one is submitted
+        report, self.timer = self.pending, None
+        if not report:
+            return
+
+        now = monotonic()
+        if now - self.last_send < self.interval:
+            # A report was sent after the timer was started
+            self.schedule(now)
+            return
+
+        self.sent(report, now, self.input_state(report))
+        self.send(report)
 
 
 class UDPServer:
+    # Packets waiting for the socket to become writable when running in
+    # an event loop, the oldest are dropped when full
+    send_queue_size = 256
+
     def __init__(self, host='', port=26760):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((host, port))
-        self.clients = dict()
+        self.loop = None
+        self.send_queue = deque()
+        self.dropped = 0
+        self.clients = Subscribers()
         self.remap = False
         self.send_touch = True
         self.controllers = {}
-        self.counters = {}
+        self.packets = {}
+        # Packets per second to all clients together, to each client and
+        # to each client while a controller is idle, 0 for no limit
+        self.rate = 0
+        self.client_rate = 0
+        self.idle_rate = 0
+        self.limiters = {}
+        self.fanout = {}
 
     def register_controller(self, controller):
         index = controller.index - 1
 
         self.controllers[index] = controller
-        self.counters[index] = 0
+        self.packets[index] = DataPacket()
+        self.limiters[index] = None
 
         def handle_report(report):
             self.report(index, controller, report)
 
+        def send_report(report):
+            # Held back reports of a device that is gone are not sent
+            if controller.device is None:
+                return
+
+            recipients = self._recipients(index, controller)
+            if recipients:
+                self._send_report(index, controller, report, recipients)
+
+        def handle_cleanup():
+            limiter = self.limiters.get(index)
+            if limiter and self.controllers.get(index) is controller:
+                limiter.reset()
+
+        if self.rate or self.client_rate or self.idle_rate:
+            self.limiters[index] = RateLimiter(
+                controller.loop, send_report,
+                interval=self._send_interval(sum(self.fanout.values())),
+                idle_interval=1 / self.idle_rate if self.idle_rate else 0)
+
         controller.loop.register_event("device-report", handle_report)
+        controller.loop.register_event("device-cleanup", handle_cleanup)
+
+    def _send_interval(self, fanout):
+        """The interval between packets to a slot's clients, for fanout
+        packets per report over all slots."""
+        interval = 1 / self.client_rate if self.client_rate else 0
+
+        if self.rate:
+            interval = max(interval, fanout / self.rate)
+
+        return interval
+
+    def _set_fanout(self, index, count):
+        self.fanout[index] = count
+        interval = self._send_interval(sum(self.fanout.values()))
+
+        for limiter in self.limiters.values():
+            if limiter:
+                limiter.interval = interval
 
     def _slot_info(self, index):
-        mac = [0x00, 0x00, 0x00, 0x00, 0x00, 0xff] # 00:00:00:00:00:FF
+        mac = NO_MAC
         conn_type = 0
         state = 0
 
@@ -111,21 +475,26 @@ class UDPServer:
         if index in self.controllers:
             controller = self.controllers[index]
 
+        gyro = 0x00
+
         if controller and controller.device:
-            mac = [int('0x' + i, 16)
-                   for i in controller.device.device_addr.split(':')]
+            mac = bytes.fromhex(
+                controller.device.device_addr.replace(':', ''))
 
             state = 2
             conn_type = 2 if controller.device.type == 'bluetooth' else 1
 
-        return [
+            if controller.options.sensors:
+                gyro = 0x02
+
+        return SLOT_INFO.pack(
             index,  # pad id
             state,
-            0x02,  # gyro (full gyro)
+            gyro,  # gyro (full gyro or none without --sensors)
             conn_type,  # connection type,
-            *mac,  # MAC,
+            mac,  # MAC,
             0xef,  # battery (charged) TODO
-        ]
+        )
 
     def _res_ports(self, index):
         return Message('ports', [
@@ -146,28 +515,80 @@ class UDPServer:
             if (index > len(self.controllers) - 1):
                 continue
 
-            self.sock.sendto(bytes(self._res_ports(index)), address)
+            self._send(bytes(self._res_ports(index)), address)
 
     def _req_data(self, message, address):
         mode = self._compat_ord(message[20])
         slot = self._compat_ord(message[21])
         mac = message[22:28]
 
-        if address not in self.clients:
-            reg = Registration(mode, slot, mac)
-            self.clients[address] = reg
+        reg = self.clients.subscribe(address, mode, slot, mac)
+        if reg:
             print('[udp] Client connected: {0[0]}:{0[1]} (mode: {1})'.format(address, reg.mode_str))
-        else:
-            self.clients[address].refresh()
 
-    def _res_data(self, message, index, controller):
-        for address, registration in self.clients.copy().items():
-            if not registration.timed_out:
-                if registration.match(index, controller):
-                    self.sock.sendto(message, address)
-            else:
-                print('[udp] Client disconnected: {0[0]}:{0[1]}'.format(address))
-                del self.clients[address]
+    def _res_data(self, message, recipients):
+        addresses, batch = recipients
+        sent = 0
+
+        # Keep the order of the queued messages when running in a loop
+        if batch and not self.send_queue:
+            try:
+                sent = batch.send(self.sock.fileno(), message)
+            except BlockingIOError:
+                pass
+            except OSError as err:
+                print('[udp] Failed to send to {0[0]}:{0[1]}: {1}'.format(addresses[0], err))
+                sent = 1
+
+        for address in addresses[sent:]:
+            self._send(message, address)
+
+    def _sweep(self):
+        for reg in self.clients.expire():
+            print('[udp] Client disconnected: {0[0]}:{0[1]} (mode: {1})'.format(reg.address, reg.mode_str))
+
+        return True
+
+    def _send(self, message, address):
+        if not self.loop:
+            try:
+                self.sock.sendto(message, address)
+            except OSError as err:
+                print('[udp] Failed to send to {0[0]}:{0[1]}: {1}'.format(address, err))
+            return
+
+        if not self.send_queue:
+            try:
+                self.sock.sendto(message, address)
+                return
+            except BlockingIOError:
+                self.loop.watch_writable(self.sock, self._flush)
+            except OSError as err:
+                print('[udp] Failed to send to {0[0]}:{0[1]}: {1}'.format(address, err))
+                return
+
+        if len(self.send_queue) >= self.send_queue_size:
+            self.send_queue.popleft()
+            self.dropped += 1
+
+        # The message may be a buffer that is reused for the next report
+        self.send_queue.append((bytes(message), address))
+
+    def _flush(self):
+        queue = self.send_queue
+
+        while queue:
+            message, address = queue[0]
+            try:
+                self.sock.sendto(message, address)
+            except BlockingIOError:
+                return
+            except OSError as err:
+                print('[udp] Failed to send to {0[0]}:{0[1]}: {1}'.format(address, err))
+
+            queue.popleft()
+
+        self.loop.unwatch_writable(self.sock)
 
     def _handle_request(self, request):
         message, address = request
@@ -184,7 +605,8 @@ class UDPServer:
         else:
             print('[udp] Unknown message type: ' + str(msg_type))
 
-    def report(self, index, controller, report):
+    def _recipients(self, index, controller):
+        """Returns the clients to send the reports of a slot to, if any."""
         if len(self.clients) == 0:
             return None
 
@@ -192,113 +614,88 @@ class UDPServer:
         if index not in self.controllers or self.controllers[index] != controller:
             return None
 
-        data = [
-            *self._slot_info(index),
-            0x01  # is active (true)
-        ]
-
-        data.extend(bytes(struct.pack('<I', self.counters[index])))
-        self.counters[index] += 1
-
-        buttons1 = 0x00
-        buttons1 |= report.button_share
-        buttons1 |= report.button_l3 << 1
-        buttons1 |= report.button_r3 << 2
-        buttons1 |= report.button_options << 3
-        buttons1 |= report.dpad_up << 4
-        buttons1 |= report.dpad_right << 5
-        buttons1 |= report.dpad_down << 6
-        buttons1 |= report.dpad_left << 7
-
-        buttons2 = 0x00
-        buttons2 |= report.button_l2
-        buttons2 |= report.button_r2 << 1
-        buttons2 |= report.button_l1 << 2
-        buttons2 |= report.button_r1 << 3
-        if not self.remap:
-            buttons2 |= report.button_triangle << 4
-            buttons2 |= report.button_circle << 5
-            buttons2 |= report.button_cross << 6
-            buttons2 |= report.button_square << 7
-        else:
-            buttons2 |= report.button_triangle << 7
-            buttons2 |= report.button_circle << 6
-            buttons2 |= report.button_cross << 5
-            buttons2 |= report.button_square << 4
-
-        data.extend([
-            buttons1, buttons2,
-            report.button_ps * 0xFF,
-            report.button_trackpad * 0xFF,
-
-            report.left_analog_x,
-            255 - report.left_analog_y,
-            report.right_analog_x,
-            255 - report.right_analog_y,
-
-            report.dpad_left * 0xFF,
-            report.dpad_down * 0xFF,
-            report.dpad_right * 0xFF,
-            report.dpad_up * 0xFF,
-
-            report.button_square * 0xFF,
-            report.button_cross * 0xFF,
-            report.button_circle * 0xFF,
-            report.button_triangle * 0xFF,
-
-            report.button_r1 * 0xFF,
-            report.button_l1 * 0xFF,
-
-            report.r2_analog,
-            report.l2_analog,
-        ])
+        if controller.device is None:
+            return None
 
-        if self.send_touch:
-            data.extend([
-                report.trackpad_touch0_active,
-                report.trackpad_touch0_id,
+        recipients = self.clients.recipients(index,
+                                             controller.device.device_addr)
+        if recipients[0]:
+            return recipients
 
-                report.trackpad_touch0_x & 255,
-                report.trackpad_touch0_x >> 8,
-                report.trackpad_touch0_y & 255,
-                report.trackpad_touch0_y >> 8,
+    def report(self, index, controller, report):
+        recipients = self._recipients(index, controller)
+        if not recipients:
+            return None
 
-                report.trackpad_touch1_active,
-                report.trackpad_touch1_id,
+        limiter = self.limiters[index]
+        if limiter:
+            if self.fanout.get(index) != len(recipients[0]):
+                self._set_fanout(index, len(recipients[0]))
 
-                report.trackpad_touch1_x & 255,
-                report.trackpad_touch1_x >> 8,
-                report.trackpad_touch1_y & 255,
-                report.trackpad_touch1_y >> 8,
-            ])
-        else:
-            data.extend([
-                0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-                0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-            ])
+            if not limiter.submit(report):
+                return None
 
-        data.extend(bytes(struct.pack('<Q', int(time() * 10**6))))
+        self._send_report(index, controller, report, recipients)
 
-        # TODO: disable sensors on a config parameter instead of commenting out
-        # sensors = [
-        #     report.orientation_roll / 8192,
-        #     - report.orientation_yaw / 8192,
-        #     - report.orientation_pitch / 8192,
-        #     report.motion_y / 16,
-        #     - report.motion_x / 16,
-        #     - report.motion_z / 16,
-        # ]
+    def _send_report(self, index, controller, report, recipients):
+        packet = self.packets[index]
+        sensors = controller.options.sensors
+        if packet.device is not controller.device or packet.sensors != sensors:
+            packet.set_slot_info(self._slot_info(index), controller.device,
+                                 sensors)
+            # Motion is integrated over the timestamps, which should not
+            # include the jitter of reading and sending the reports
+            packet.clock = controller.device.sync_clock()
 
-        # for sensor in sensors:
-        #     data.extend(bytes(struct.pack('<f', float(sensor))))
-
-        self._res_data(bytes(Message('data', data)), index, controller)
+        self._res_data(packet.fill(report, self.remap, self.send_touch,
+                                   packet.clock.time(report.timestamp)),
+                       recipients)
 
     def _worker(self):
+        # The controller threads send on the same socket, which has to
+        # stay blocking, so the sweep timeout is waited for with poll
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN)
+        next_sweep = monotonic() + SWEEP_INTERVAL
+
         while True:
-            self._handle_request(self.sock.recvfrom(1024))
+            timeout = max(next_sweep - monotonic(), 0)
+            if poller.poll(timeout * 1000):
+                try:
+                    self._handle_request(self.sock.recvfrom(1024))
+                except OSError as err:
+                    print('[udp] Failed to receive: {0}'.format(err))
+
+            if monotonic() >= next_sweep:
+                self._sweep()
+                next_sweep = monotonic() + SWEEP_INTERVAL
+
+    def _read_requests(self):
+        while True:
+            try:
+                request = self.sock.recvfrom(1024)
+            except BlockingIOError:
+                return
+            except OSError as err:
+                print('[udp] Failed to receive: {0}'.format(err))
+                return
+
+            self._handle_request(request)
+
+    def start(self, loop=None):
+        """Starts handling client requests.
+
+        With a loop the socket is made non-blocking and requests and
+        sends are handled by the loop, which must also be the one that
+        runs the controllers. Otherwise a thread handles the requests.
+        """
+        if loop:
+            self.loop = loop
+            self.sock.setblocking(False)
+            loop.add_watcher(self.sock, self._read_requests)
+            loop.create_timer(SWEEP_INTERVAL, self._sweep).start()
+            return
 
-    def start(self):
         self.thread = Thread(target=self._worker)
         self.thread.daemon = True
         self.thread.start()
@@ -0,0 +1,464 @@
+"""Streams the reports of the controllers to local processes.
+
+Clients connect to a AF_UNIX SOCK_SEQPACKET socket and subscribe to a
+controller with a single text message of key=value pairs:
+
+    controller=1 format=decoded fields=left_analog_x,button_mask rate=120
+
+format is either raw, the HID input report as read from the device, or
+decoded, a packed record of the requested fields (default all of
+FIELD_FORMATS). rate caps the records per second, button changes are
+always sent right away. The server replies with "ok" followed by the
+struct formats of the record header and of the decoded fields, or with
+"error <reason>" before closing the connection. Then every message is
+a record:
+
+    header (RECORD_HEADER): sequence number, time of the report
+    data: the raw report, or the decoded fields packed as announced
+
+Records are never waited for. When a client doesn't keep up they are
+queued, up to its queue size, and then the oldest are dropped, which
+shows as gaps in the sequence numbers.
+"""
+
+from collections import deque
+from threading import Lock, Thread
+import errno
+import os
+import socket
+import struct
+from time import monotonic
+
+from .udp import RateLimiter
+
+# Sequence number and the time of the report on the host's monotonic
+# clock, in seconds
+RECORD_HEADER = struct.Struct('<Id')
+
+# The values of DSReport and how they are packed in decoded records
+FIELD_FORMATS = dict(
+    [(name, 'B') for name in ('left_analog_x', 'left_analog_y',
+                              'right_analog_x', 'right_analog_y',
+                              'l2_analog', 'r2_analog')] +
+    [(name, '?') for name in ('dpad_up', 'dpad_down', 'dpad_left',
+                              'dpad_right', 'button_cross', 'button_circle',
+                              'button_square', 'button_triangle',
+                              'button_l1', 'button_l2', 'button_l3',
+                              'button_r1', 'button_r2', 'button_r3',
+                              'button_share', 'button_options',
+                              'button_trackpad', 'button_ps')] +
+    [(name, 'h') for name in ('motion_y', 'motion_x', 'motion_z',
+                              'orientation_roll', 'orientation_yaw',
+                              'orientation_pitch')] +
+    [('trackpad_touch{0}_{1}'.format(touch, name), fmt)
+     for touch in (0, 1)
+     for name, fmt in (('id', 'B'), ('active', '?'), ('x', 'H'),
+                       ('y', 'H'))] +
+    [('timestamp', 'B'), ('battery', 'B'), ('plug_usb', '?'),
+     ('plug_audio', '?'), ('plug_mic', '?'), ('button_mask', 'I')])
+
+# Fields of a decoded record when none are requested, in report order
+DEFAULT_FIELDS = ('left_analog_x', 'left_analog_y', 'right_analog_x',
+                  'right_analog_y', 'l2_analog', 'r2_analog', 'button_mask',
+                  'motion_y', 'motion_x', 'motion_z', 'orientation_roll',
+                  'orientation_yaw', 'orientation_pitch',
+                  'trackpad_touch0_id', 'trackpad_touch0_active',
+                  'trackpad_touch0_x', 'trackpad_touch0_y',
+                  'trackpad_touch1_id', 'trackpad_touch1_active',
+                  'trackpad_touch1_x', 'trackpad_touch1_y',
+                  'timestamp', 'battery', 'plug_usb', 'plug_audio',
+                  'plug_mic')
+
+FORMATS = ('raw', 'decoded')
+
+# Seconds a new connection has to send its subscription
+REQUEST_TIMEOUT = 1.0
+REQUEST_SIZE = 4096
+
+
+def default_path():
+    """The socket path in the user's runtime directory."""
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'dsdrv.sock')
+
+    return '/tmp/dsdrv-{0}.sock'.format(os.getuid())
+
+
+class RequestError(ValueError):
+    pass
+
+
+class Subscriber(object):
+    """A connection subscribed to the reports of a controller."""
+
+    def __init__(self, conn, index, fmt, fields, rate, queue_size):
+        self.conn = conn
+        self.index = index
+        self.format = fmt
+        self.fields = fields
+        self.rate = rate
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.limiter = None
+
+        # The loop of the controller, which flushes the queue once the
+        # connection is writable again
+        self.loop = None
+        self.flushing = False
+
+        if fmt == 'decoded':
+            self.struct = struct.Struct(
+                '<' + ''.join(FIELD_FORMATS[name] for name in fields))
+            self.getter = self._getter(fields)
+        else:
+            self.struct = None
+
+    @staticmethod
+    def _getter(fields):
+        # A tuple is what the struct wants, even for a single field
+        names = tuple(fields)
+        return lambda report: tuple(getattr(report, name) for name in names)
+
+    def record(self, report, timestamp):
+        """Returns the record of a report."""
+        header = RECORD_HEADER.pack(self.sequence & 0xffffffff, timestamp)
+        self.sequence += 1
+
+        if self.struct:
+            return header + self.struct.pack(*self.getter(report))
+
+        return header + bytes(report.raw)
+
+    def send(self, record):
+        """Sends a record, or queues it while the client is busy.
+
+        Raises OSError when the connection is gone.
+        """
+        queue = self.queue
+        if queue and not self.flush():
+            if len(queue) >= self.queue_size:
+                queue.popleft()
+                self.dropped += 1
+
+            queue.append(record)
+            return
+
+        try:
+            self.conn.send(record)
+            self.sent += 1
+        except BlockingIOError:
+            queue.append(record)
+
+    def flush(self):
+        """Sends the queued records, returns True once they are all sent."""
+        queue = self.queue
+        while queue:
+            try:
+                self.conn.send(queue[0])
+            except BlockingIOError:
+                return False
+
+            queue.popleft()
+            self.sent += 1
+
+        return True
+
+    def describe(self):
+        return 'controller {0}, {1}{2}'.format(
+            self.index + 1, self.format,
+            ', {0} Hz'.format(self.rate) if self.rate else '')
+
+
+class UnixServer(object):
+    # Records queued per client before the oldest are dropped
+    queue_size = 64
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self.loop = None
+        self.controllers = {}
+        self.subscribers = {}
+        self.lock = Lock()
+
+        if os.path.exists(self.path):
+            self._remove_stale_socket()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.sock.listen(8)
+
+    def _remove_stale_socket(self):
+        """Removes the socket of an earlier run, raises OSError if another
+        process is still listening on it."""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            sock.connect(self.path)
+        except OSError as err:
+            if err.errno != errno.ECONNREFUSED:
+                raise
+
+            # Left behind by an earlier run
+            os.unlink(self.path)
+            return
+        finally:
+            sock.close()
+
+        raise OSError(errno.EADDRINUSE, 'Socket is in use by another '
+                      'process', self.path)
+
+    def register_controller(self, controller):
+        index = controller.index - 1
+        self.controllers[index] = controller
+        self.subscribers.setdefault(index, ())
+
+        def handle_report(report):
+            self.report(index, controller, report)
+
+        def handle_cleanup():
+            if self.controllers.get(index) is not controller:
+                return
+
+            # Held back records of a device that is gone are not sent
+            for subscriber in self.subscribers.get(index, ()):
+                if subscriber.limiter:
+                    subscriber.limiter.reset()
+
+        controller.loop.register_event('device-report', handle_report)
+        controller.loop.register_event('device-cleanup', handle_cleanup)
+
+    def report(self, index, controller, report):
+        subscribers = self.subscribers.get(index)
+        if not subscribers:
+            return
+
+        # Ignore outdated callbacks
+        if self.controllers.get(index) is not controller:
+            return
+
+        for subscriber in subscribers:
+            limiter = subscriber.limiter
+            if limiter is None and subscriber.rate:
+                limiter = subscriber.limiter = RateLimiter(
+                    controller.loop, self._deliver_later(subscriber,
+                                                         controller),
+                    interval=1 / subscriber.rate)
+
+            if limiter and not limiter.submit(report):
+                continue
+
+            self._deliver(subscriber, controller, report)
+
+    def _deliver_later(self, subscriber, controller):
+        def deliver(report):
+            if subscriber in self.subscribers.get(subscriber.index, ()):
+                self._deliver(subscriber, controller, report)
+
+        return deliver
+
+    def _deliver(self, subscriber, controller, report):
+        if controller.device is None:
+            return
+
+        # The time without the jitter of reading the report, once the
+        # clock has seen a report
+        timestamp = controller.device.sync_clock().time(report.timestamp)
+        if timestamp is None:
+            timestamp = monotonic()
+
+        try:
+            subscriber.send(subscriber.record(report, timestamp))
+        except OSError:
+            self._unsubscribe(subscriber)
+            return
+
+        if subscriber.queue and not subscriber.flushing:
+            subscriber.flushing = True
+            subscriber.loop.watch_writable(subscriber.conn,
+                                           lambda: self._flush(subscriber))
+
+    def _flush(self, subscriber):
+        """Sends the queued records once the connection is writable."""
+        try:
+            done = subscriber.flush()
+        except OSError:
+            self._unsubscribe(subscriber)
+            return
+
+        if done:
+            subscriber.flushing = False
+            subscriber.loop.unwatch_writable(subscriber.conn)
+
+    def _read_subscriber(self, subscriber):
+        """Clients send nothing after subscribing, this notices when
+        they hang up."""
+        try:
+            data = subscriber.conn.recv(REQUEST_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = None
+
+        if not data:
+            self._unsubscribe(subscriber)
+
+    def _subscribe(self, subscriber):
+        subscriber.loop = self.controllers[subscriber.index].loop
+        subscriber.loop.add_watcher(subscriber.conn,
+                                    lambda: self._read_subscriber(subscriber))
+
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.index, ())
+            self.subscribers[subscriber.index] = subscribers + (subscriber,)
+
+        print('[unix] Client subscribed: {0}'.format(subscriber.describe()))
+
+    def _unsubscribe(self, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.index, ())
+            if subscriber not in subscribers:
+                return
+
+            self.subscribers[subscriber.index] = tuple(
+                s for s in subscribers if s is not subscriber)
+
+        if subscriber.limiter:
+            subscriber.limiter.reset()
+
+        subscriber.loop.remove_watcher(subscriber.conn)
+        subscriber.conn.close()
+        print('[unix] Client disconnected: {0} (sent {1}, dropped {2})'
+              .format(subscriber.describe(), subscriber.sent,
+                      subscriber.dropped))
+
+    def parse_request(self, conn, request):
+        """Returns the Subscriber for a subscription message."""
+        try:
+            params = dict(item.split('=', 1)
+                          for item in request.decode('ascii').split())
+        except ValueError:
+            raise RequestError('malformed request')
+
+        try:
+            index = int(params.pop('controller', '1')) - 1
+            rate = float(params.pop('rate', '0'))
+            queue_size = int(params.pop('queue', self.queue_size))
+        except ValueError as err:
+            raise RequestError(err)
+
+        if index not in self.controllers:
+            raise RequestError('unknown controller {0}'.format(index + 1))
+
+        if rate < 0 or queue_size < 1:
+            raise RequestError('rate and queue must be positive')
+
+        fmt = params.pop('format', 'decoded')
+        if fmt not in FORMATS:
+            raise RequestError('unknown format {0}'.format(fmt))
+
+        fields = DEFAULT_FIELDS
+        if 'fields' in params:
+            fields = tuple(params.pop('fields').split(','))
+            unknown = [name for name in fields if name not in FIELD_FORMATS]
+            if unknown:
+                raise RequestError('unknown fields {0}'.format(
+                    ','.join(unknown)))
+
+        if params:
+            raise RequestError('unknown parameters {0}'.format(
+                ','.join(params)))
+
+        return Subscriber(conn, index, fmt, fields, rate, queue_size)
+
+    def _handle_request(self, conn, request):
+        try:
+            subscriber = self.parse_request(conn, request)
+        except RequestError as err:
+            conn.send('error {0}'.format(err).encode('ascii'))
+            conn.close()
+            return
+
+        reply = 'ok header={0}'.format(RECORD_HEADER.format)
+        if subscriber.struct:
+            reply += ' record={0} fields={1}'.format(
+                subscriber.struct.format, ','.join(subscriber.fields))
+
+        conn.send(reply.encode('ascii'))
+        conn.setblocking(False)
+        self._subscribe(subscriber)
+
+    def _accept(self):
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except BlockingIOError:
+                return
+            except OSError as err:
+                print('[unix] Failed to accept: {0}'.format(err))
+                return
+
+            conn.setblocking(False)
+            self.loop.add_watcher(conn, lambda conn=conn:
+                                  self._read_request(conn))
+
+    def _read_request(self, conn):
+        self.loop.remove_watcher(conn)
+
+        try:
+            request = conn.recv(REQUEST_SIZE)
+            conn.setblocking(True)
+            if request:
+                self._handle_request(conn, request)
+            else:
+                conn.close()
+        except OSError as err:
+            print('[unix] Failed to read request: {0}'.format(err))
+            conn.close()
+
+    def _worker(self):
+        while True:
+            conn, address = self.sock.accept()
+            conn.settimeout(REQUEST_TIMEOUT)
+
+            try:
+                request = conn.recv(REQUEST_SIZE)
+                if request:
+                    self._handle_request(conn, request)
+                else:
+                    conn.close()
+            except OSError as err:
+                print('[unix] Failed to read request: {0}'.format(err))
+                conn.close()
+
+    def start(self, loop=None):
+        """Starts accepting clients.
+
+        With a loop the connections are handled by the loop, which must
+        also be the one that runs the controllers. Otherwise a thread
+        accepts them. Records are always sent by the loop of their
+        controller.
+        """
+        print('[unix] Listening on {0}'.format(self.path))
+
+        if loop:
+            self.loop = loop
+            self.sock.setblocking(False)
+            loop.add_watcher(self.sock, self._accept)
+            return
+
+        self.thread = Thread(target=self._worker)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        """Closes the socket and removes its path."""
+        self.sock.close()
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,219 @@
+"""Shares the states of a controller with other local processes.
+
+A state file in /dev/shm holds a header and a ring of fixed size
+records, one for every report. Readers map the file and read the states
+straight from memory, without syscalls:
+
+    from dsdrv.shm import StateReader
+
+    reader = StateReader("/dev/shm/dsdrv-1")
+    state = reader.latest()
+    if state:
+        print(state.left_analog_x, state.button_mask)
+
+Every record has a sequence number that is odd while the record is
+being written (a seqlock), a reader that sees it change retries. The
+header counts the records written, the latest state is in record
+(written - 1) % capacity.
+"""
+
+import mmap
+import os
+
+from collections import namedtuple
+from struct import Struct
+
+MAGIC = b"DSDRVSHM"
+VERSION = 1
+
+# Magic, version, header size, record size, capacity, flags and the
+# number of records written, aligned to 8 bytes
+HEADER = Struct("<8sIIIII4xQ")
+HEADER_SIZE = 64
+FLAGS_OFFSET = 24
+WRITTEN_OFFSET = 32
+FLAG_CONNECTED = 1
+
+U32 = Struct("<I")
+U64 = Struct("<Q")
+
+# Sequence number, reserved, then the state
+SEQ = U32
+RECORD_SIZE = 64
+STATE_OFFSET = 8
+STATE = Struct("<QdI6BBB2B2H2B2H6hB")
+
+State = namedtuple("State", [
+    "number", "time", "button_mask",
+    "left_analog_x", "left_analog_y", "right_analog_x", "right_analog_y",
+    "l2_analog", "r2_analog",
+    "battery", "plugs",
+    "trackpad_touch0_active", "trackpad_touch0_id",
+    "trackpad_touch0_x", "trackpad_touch0_y",
+    "trackpad_touch1_active", "trackpad_touch1_id",
+    "trackpad_touch1_x", "trackpad_touch1_y",
+    "motion_y", "motion_x", "motion_z",
+    "orientation_roll", "orientation_yaw", "orientation_pitch",
+    "counter",
+])
+"""A published report.
+
+number counts the reports of the file, time is the host monotonic time
+the report was published at and button_mask is DSReport.button_mask.
+plugs has bit 0 set for USB, 1 for audio and 2 for a mic.
+"""
+
+PLUG_USB = 1
+PLUG_AUDIO = 2
+PLUG_MIC = 4
+
+
+def state_path(index):
+    """The state file of a controller."""
+    return "/dev/shm/dsdrv-{0}".format(index)
+
+
+class StateWriter(object):
+    """Publishes reports to a state file."""
+
+    def __init__(self, path, capacity=256):
+        self.path = path
+        self.capacity = capacity
+        self.written = 0
+        self.seqs = [0] * capacity
+        self.scratch = bytearray(STATE.size)
+
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+        tmp_path = "{0}.{1}".format(path, os.getpid())
+
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, HEADER_SIZE,
+                         RECORD_SIZE, capacity, FLAG_CONNECTED, 0)
+
+        # Readers only ever see a complete file
+        os.rename(tmp_path, path)
+
+    def publish(self, report, now):
+        """Writes report as the latest state."""
+        number = self.written
+        index = number % self.capacity
+        offset = HEADER_SIZE + index * RECORD_SIZE
+        seq = self.seqs[index] + 1
+        buf = self.map
+        r = report
+
+        # Packed aside first, a report that doesn't fit never touches
+        # the ring
+        STATE.pack_into(
+            self.scratch, 0, number, now, r.button_mask,
+            r.left_analog_x, r.left_analog_y,
+            r.right_analog_x, r.right_analog_y,
+            r.l2_analog, r.r2_analog,
+            r.battery,
+            r.plug_usb | r.plug_audio << 1 | r.plug_mic << 2,
+            r.trackpad_touch0_active, r.trackpad_touch0_id,
+            r.trackpad_touch0_x, r.trackpad_touch0_y,
+            r.trackpad_touch1_active, r.trackpad_touch1_id,
+            r.trackpad_touch1_x, r.trackpad_touch1_y,
+            r.motion_y, r.motion_x, r.motion_z,
+            r.orientation_roll, r.orientation_yaw, r.orientation_pitch,
+            r.timestamp)
+
+        state = offset + STATE_OFFSET
+        SEQ.pack_into(buf, offset, seq)
+        buf[state:state + STATE.size] = self.scratch
+        SEQ.pack_into(buf, offset, seq + 1)
+
+        self.seqs[index] = seq + 1
+        self.written = number + 1
+        U64.pack_into(buf, WRITTEN_OFFSET, number + 1)
+
+    def close(self):
+        """Marks the controller as disconnected and removes the file.
+
+        Readers that still have it open see StateReader.connected turn
+        False.
+        """
+        U32.pack_into(self.map, FLAGS_OFFSET, 0)
+        self.map.close()
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class StateReader(object):
+    """Reads the states published to a state file."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, header_size, record_size, self.capacity,
+         flags, written) = HEADER.unpack_from(self.map)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a dsdrv state file: {0}".format(path))
+
+        self.header_size = header_size
+        self.record_size = record_size
+
+    @property
+    def connected(self):
+        """False once the controller has disconnected, reopen the file
+        to read the states of the next connection."""
+        return bool(U32.unpack_from(self.map, FLAGS_OFFSET)[0] &
+                    FLAG_CONNECTED)
+
+    @property
+    def written(self):
+        """The number of states published so far."""
+        return U64.unpack_from(self.map, WRITTEN_OFFSET)[0]
+
+    def read(self, number):
+        """Returns state number, or None if it was already overwritten."""
+        offset = (self.header_size +
+                  (number % self.capacity) * self.record_size)
+
+        while True:
+            seq = SEQ.unpack_from(self.map, offset)[0]
+            if seq & 1:
+                continue
+
+            values = STATE.unpack_from(self.map, offset + STATE_OFFSET)
+            if SEQ.unpack_from(self.map, offset)[0] != seq:
+                continue
+
+            if values[0] != number:
+                return None
+
+            return State(*values)
+
+    def latest(self):
+        """Returns the latest state, or None if there is none yet."""
+        while True:
+            written = self.written
+            if not written:
+                return None
+
+            state = self.read(written - 1)
+            if state:
+                return state
+
+    def recent(self, count):
+        """Returns up to count of the latest states, oldest first."""
+        written = self.written
+        first = max(written - min(count, self.capacity), 0)
+
+        states = [self.read(number) for number in range(first, written)]
+        return [state for state in states if state]
+
+    def close(self):
+        self.map.close()
@@ -1,12 +1,17 @@
-import os.path
+import os
 import time
 
 from collections import namedtuple
+from operator import attrgetter, getitem
+from struct import Struct
 
 from evdev import UInput, UInputError, ecodes
 from evdev import util
 
+from .device import BUTTON_FIELDS, SENSOR_FIELDS
 from .exceptions import DeviceError
+from .response import (DEFAULT_RESPONSE, SQUARES, Response, partner_axis,
+                       parse_response_option)
 
 # Check for the existence of a "resolve_ecodes_dict" function.
 # Need to know if axis options tuples should be altered.
@@ -22,10 +27,14 @@ DEFAULT_MOUSE_DEADZONE = 5
 DEFAULT_SCROLL_REPEAT_DELAY = .250 # Seconds to wait before continual scrolling
 DEFAULT_SCROLL_DELAY = .035        # Seconds to wait between scroll events
 
+# struct input_event: time (seconds and microseconds), type, code and
+# value. The time is set by the kernel when the event is injected.
+INPUT_EVENT = Struct("llHHi")
+
 UInputMapping = namedtuple("UInputMapping",
                            "name bustype vendor product version "
                            "axes axes_options buttons hats keys mouse "
-                           "mouse_options")
+                           "mouse_options responses")
 
 _mappings = {}
 
@@ -46,16 +55,18 @@ def parse_button(attr):
 
 def create_mapping(name, description, bustype=0, vendor=0, product=0,
                    version=0, axes={}, axes_options={}, buttons={},
-                   hats={}, keys={}, mouse={}, mouse_options={}):
+                   hats={}, keys={}, mouse={}, mouse_options={},
+                   responses={}):
     axes = {getattr(ecodes, k): v for k,v in axes.items()}
     axes_options = {getattr(ecodes, k): v for k,v in axes_options.items()}
     buttons = {getattr(ecodes, k): parse_button(v) for k,v in buttons.items()}
     hats = {getattr(ecodes, k): v for k,v in hats.items()}
     mouse = {getattr(ecodes, k): parse_button(v) for k,v in mouse.items()}
+    responses = {getattr(ecodes, k): v for k,v in responses.items()}
 
     mapping = UInputMapping(description, bustype, vendor, product, version,
                             axes, axes_options, buttons, hats, keys, mouse,
-                            mouse_options)
+                            mouse_options, responses)
     _mappings[name] = mapping
 
 
@@ -73,23 +84,22 @@ create_mapping(
         "ABS_RZ":       "right_analog_y",
         "ABS_RX":       "l2_analog",
         "ABS_RY":       "r2_analog",
-        # TODO: disable sensors on a config parameter instead of commenting out
-        # "ABS_THROTTLE": "orientation_roll",
-        # "ABS_RUDDER":   "orientation_pitch",
-        # "ABS_WHEEL":    "orientation_yaw",
-        # "ABS_DISTANCE": "motion_z",
-        # "ABS_TILT_X":   "motion_x",
-        # "ABS_TILT_Y":   "motion_y",
+        # Only used with --sensors
+        "ABS_THROTTLE": "orientation_roll",
+        "ABS_RUDDER":   "orientation_pitch",
+        "ABS_WHEEL":    "orientation_yaw",
+        "ABS_DISTANCE": "motion_z",
+        "ABS_TILT_X":   "motion_x",
+        "ABS_TILT_Y":   "motion_y",
     },
     # Axes options
     {
-        # TODO: disable sensors on a config parameter instead of commenting out
-        # "ABS_THROTTLE": (0, -16385, 16384, 0, 0),
-        # "ABS_RUDDER":   (0, -16385, 16384, 0, 0),
-        # "ABS_WHEEL":    (0, -16385, 16384, 0, 0),
-        # "ABS_DISTANCE": (0, -32768, 32767, 0, 10),
-        # "ABS_TILT_X":   (0, -32768, 32767, 0, 10),
-        # "ABS_TILT_Y":   (0, -32768, 32767, 0, 10),
+        "ABS_THROTTLE": (0, -16385, 16384, 0, 0),
+        "ABS_RUDDER":   (0, -16385, 16384, 0, 0),
+        "ABS_WHEEL":    (0, -16385, 16384, 0, 0),
+        "ABS_DISTANCE": (0, -32768, 32767, 0, 10),
+        "ABS_TILT_X":   (0, -32768, 32767, 0, 10),
+        "ABS_TILT_Y":   (0, -32768, 32767, 0, 10),
     },
     # Buttons
     {
@@ -235,14 +245,178 @@ create_mapping(
 )
 
 
+def tuple_getter(attrs):
+    """Returns a function that gets attrs from an object as a tuple."""
+    if len(attrs) > 1:
+        return attrgetter(*attrs)
+    elif attrs:
+        attr = attrs[0]
+        return lambda obj: (getattr(obj, attr),)
+    else:
+        return lambda obj: ()
+
+
+def hat_value(negative, positive):
+    if negative:
+        return -1
+    elif positive:
+        return 1
+    else:
+        return 0
+
+
+class EmitPlan(object):
+    """The axes, buttons and hats of a layout compiled for emit().
+
+    values(report) returns the value of every event of the plan, in the
+    order of events. Values that are simply report attributes are read
+    with a single attrgetter, axes with a response and analog buttons
+    are looked up in a table by the value of their attribute. Ignored
+    buttons are always False. Hats of buttons are looked up by the bits
+    of the button mask. Only axes with a radial deadzone are computed
+    one by one.
+    """
+
+    def __init__(self, layout, ignored_buttons=()):
+        plain, tables, ignored, hats, computed = [], [], [], [], []
+
+        for name, attr in layout.axes.items():
+            event = (ecodes.EV_ABS, name)
+            params = layout.axes_options.get(name, DEFAULT_AXIS_OPTIONS)
+            reset = int(sum(params[1:3]) / 2)
+            response = layout.responses.get(name)
+
+            if not response:
+                plain.append((event, attr, reset))
+                continue
+
+            table = response.axis_table(attr, params[1], params[2])
+            if response.radial_deadzone:
+                computed.append((event, self._radial(attr, table, reset,
+                                                     response), reset))
+            else:
+                tables.append((event, attr, table, reset))
+
+        for name, (attr, modifier) in layout.buttons.items():
+            event = (ecodes.EV_KEY, name)
+            if attr in ignored_buttons:
+                ignored.append(event)
+            elif modifier and "analog" in attr:
+                response = layout.responses.get(name, DEFAULT_RESPONSE)
+                tables.append((event, attr,
+                               self._threshold(modifier, response), False))
+            else:
+                plain.append((event, attr, False))
+
+        for name, buttons in layout.hats.items():
+            hats.append(((ecodes.EV_ABS, name), buttons))
+
+        self.events = tuple([event for event, attr, reset in plain] +
+                            [event for event, attr, t, reset in tables] +
+                            ignored +
+                            [event for event, buttons in hats] +
+                            [event for event, func, reset in computed])
+        self.reset_values = tuple([reset for event, attr, reset in plain] +
+                                  [reset for e, a, t, reset in tables] +
+                                  [False] * len(ignored) +
+                                  [0] * len(hats) +
+                                  [reset for e, func, reset in computed])
+
+        plain_values = tuple_getter([attr for event, attr, reset in plain])
+        table_values = self._tables([table for e, a, table, r in tables],
+                                    [attr for e, attr, t, r in tables])
+        ignored_values = (False,) * len(ignored)
+        hat_values = self._hats([buttons for event, buttons in hats])
+        funcs = tuple(func for event, func, reset in computed)
+
+        if computed:
+            self.values = lambda report: (plain_values(report) +
+                                          table_values(report) +
+                                          ignored_values +
+                                          hat_values(report) +
+                                          tuple(f(report) for f in funcs))
+        elif tables or ignored or hats:
+            self.values = lambda report: (plain_values(report) +
+                                          table_values(report) +
+                                          ignored_values +
+                                          hat_values(report))
+        else:
+            self.values = plain_values
+
+    @staticmethod
+    def _threshold(modifier, response):
+        """Whether an analog value is pressed towards the modifier."""
+        deadzone = response.deadzone
+        if deadzone is None:
+            deadzone = DEFAULT_A2D_DEADZONE
+
+        if modifier == "+":
+            return tuple(value > 128 + deadzone for value in range(256))
+        else:
+            return tuple(value < 128 - deadzone for value in range(256))
+
+    @staticmethod
+    def _radial(attr, table, center, response):
+        """Looks up an axis of a stick that is centered while the stick
+        is within a radial deadzone."""
+        partner = partner_axis(attr)
+        limit = response.radial_deadzone ** 2
+
+        def radial(report):
+            value = getattr(report, attr)
+            if SQUARES[value] + SQUARES[getattr(report, partner)] <= limit:
+                return center
+
+            return table[value]
+
+        return radial
+
+    @staticmethod
+    def _tables(tables, attrs):
+        """Looks up the values of attrs in tables."""
+        if not tables:
+            return lambda report: ()
+
+        tables = tuple(tables)
+        values = tuple_getter(attrs)
+        return lambda report: tuple(map(getitem, tables, values(report)))
+
+    @staticmethod
+    def _hats(hats):
+        """Computes the values of hats from their negative and positive
+        buttons."""
+        if not hats:
+            return lambda report: ()
+
+        attrs = [attr for buttons in hats for attr in buttons]
+        if not all(attr in BUTTON_FIELDS for attr in attrs):
+            values = tuple_getter(attrs)
+            return lambda report: tuple(
+                map(hat_value, *[iter(values(report))] * 2))
+
+        # All the values at once for every combination of the bits
+        bits = [BUTTON_FIELDS.index(attr) for attr in attrs]
+        mask = sum(1 << bit for bit in bits)
+        table = {}
+        for combination in range(1 << len(bits)):
+            pressed = [(combination >> i) & 1 for i in range(len(bits))]
+            key = sum(1 << bit for bit, p in zip(bits, pressed) if p)
+            table[key] = tuple(map(hat_value, *[iter(pressed)] * 2))
+
+        return lambda report: table[report.button_mask & mask]
+
+
 class UInputDevice(object):
     def __init__(self, layout):
         self.joystick_dev = None
         self.evdev_dev = None
-        self.ignored_buttons = set()
+        self.ignored_buttons = frozenset()
         self.create_device(layout)
 
-        self._write_cache = {}
+        # Plans of the layout by ignored buttons, the values last written
+        self._plans = {}
+        self.plan = self.compile_plan(self.ignored_buttons)
+        self._values = None
         self._scroll_details = {}
         self.emit_reset()
 
@@ -270,6 +444,12 @@ class UInputDevice(object):
         for name in layout.buttons:
             events[ecodes.EV_KEY].append(name)
 
+        # Values that make emit_mouse() move the mouse or scroll, the
+        # sticks with their movement by value
+        self.mouse_triggers = []
+        self.mouse_analogs = []
+        self.mouse_tables = {}
+
         if layout.mouse:
             self.mouse_pos = {}
             self.mouse_rel = {}
@@ -290,6 +470,19 @@ class UInputDevice(object):
                                          DEFAULT_SCROLL_DELAY)
             )
 
+            for name, (attr, modifier) in layout.mouse.items():
+                if attr.startswith("trackpad_touch"):
+                    self.mouse_triggers.append(attr[:16] + "active")
+                elif "analog" in attr:
+                    response = layout.responses.get(name, DEFAULT_RESPONSE)
+                    table = response.mouse_table(
+                        modifier, self.mouse_analog_sensitivity,
+                        self.mouse_analog_deadzone)
+                    self.mouse_tables[name] = table
+                    self.mouse_analogs.append((attr, table))
+                elif name in (ecodes.REL_WHEELUP, ecodes.REL_WHEELDOWN):
+                    self.mouse_triggers.append(attr)
+
             for name in layout.mouse:
                 if name in (ecodes.REL_WHEELUP, ecodes.REL_WHEELDOWN):
                     if ecodes.REL_WHEEL not in events[ecodes.EV_REL]:
@@ -304,61 +497,100 @@ class UInputDevice(object):
                              product=layout.product, version=layout.version)
         self.layout = layout
 
-    def write_event(self, etype, code, value):
-        """Writes a event to the device, if it has changed."""
-        last_value = self._write_cache.get(code)
-        if last_value != value:
-            self.device.write(etype, code, value)
-            self._write_cache[code] = value
+        # The events of a frame are gathered here and written at once by
+        # syn(), a frame has at most one event per code and a SYN_REPORT
+        codes = (len(layout.axes) + len(layout.buttons) + len(layout.hats) +
+                 len(layout.mouse))
+        self.frame = bytearray(INPUT_EVENT.size * (codes + 1))
+        self.frame_size = 0
+
+    def write(self, etype, code, value):
+        """Adds an event to the current frame."""
+        INPUT_EVENT.pack_into(self.frame, self.frame_size, 0, 0, etype, code,
+                              value)
+        self.frame_size += INPUT_EVENT.size
+
+    def syn(self):
+        """Ends the current frame and writes all its events at once."""
+        if not self.frame_size:
+            return
+
+        self.write(ecodes.EV_SYN, ecodes.SYN_REPORT, 0)
+        with memoryview(self.frame) as frame:
+            os.write(self.device.fd, frame[:self.frame_size])
+
+        self.frame_size = 0
+
+    def compile_plan(self, ignored_buttons):
+        """Returns the EmitPlan of the layout for a set of ignored
+        buttons, compiled only the first time it is asked for."""
+        plan = self._plans.get(ignored_buttons)
+        if not plan:
+            plan = self._plans[ignored_buttons] = EmitPlan(self.layout,
+                                                           ignored_buttons)
+
+        return plan
+
+    def set_ignored_buttons(self, buttons):
+        """Sets the buttons that are never sent as pressed."""
+        buttons = frozenset(buttons)
+        if buttons == self.ignored_buttons:
+            return
+
+        # The values written so far, in the order of the new plan
+        plan = self.compile_plan(buttons)
+        if self._values is not None:
+            written = dict(zip(self.plan.events, self._values))
+            self._values = tuple(written.get(event)
+                                 for event in plan.events)
+
+        self.ignored_buttons = buttons
+        self.plan = plan
+
+    def _write_values(self, values):
+        """Writes the values that changed since the last write."""
+        last = self._values
+        if values == last:
+            return
+
+        pack = INPUT_EVENT.pack_into
+        frame, offset, size = self.frame, self.frame_size, INPUT_EVENT.size
+        if last is None:
+            for (etype, code), value in zip(self.plan.events, values):
+                pack(frame, offset, 0, 0, etype, code, value)
+                offset += size
+        else:
+            for (etype, code), value, last_value in zip(self.plan.events,
+                                                        values, last):
+                if value != last_value:
+                    pack(frame, offset, 0, 0, etype, code, value)
+                    offset += size
+
+        self.frame_size = offset
+        self._values = values
+        self.syn()
 
     def emit(self, report):
         """Writes axes, buttons and hats with values from the report to
         the device."""
-        for name, attr in self.layout.axes.items():
-            value = getattr(report, attr)
-            self.write_event(ecodes.EV_ABS, name, value)
-
-        for name, attr in self.layout.buttons.items():
-            attr, modifier = attr
-
-            if attr in self.ignored_buttons:
-                value = False
-            else:
-                value = getattr(report, attr)
-
-            if modifier and "analog" in attr:
-                if modifier == "+":
-                    value = value > (128 + DEFAULT_A2D_DEADZONE)
-                elif modifier == "-":
-                    value = value < (128 - DEFAULT_A2D_DEADZONE)
-
-            self.write_event(ecodes.EV_KEY, name, value)
-
-        for name, attr in self.layout.hats.items():
-            if getattr(report, attr[0]):
-                value = -1
-            elif getattr(report, attr[1]):
-                value = 1
-            else:
-                value = 0
-
-            self.write_event(ecodes.EV_ABS, name, value)
-
-        self.device.syn()
+        self._write_values(self.plan.values(report))
 
     def emit_reset(self):
         """Resets the device to a blank state."""
-        for name in self.layout.axes:
-            params = self.layout.axes_options.get(name, DEFAULT_AXIS_OPTIONS)
-            self.write_event(ecodes.EV_ABS, name, int(sum(params[1:3]) / 2))
+        self._write_values(self.plan.reset_values)
 
-        for name in self.layout.buttons:
-            self.write_event(ecodes.EV_KEY, name, False)
+    def mouse_motion(self, report):
+        """Whether emit_mouse() has something to do for a report: a
+        touch, a stick out of the deadzone or a held scroll button."""
+        for attr in self.mouse_triggers:
+            if getattr(report, attr):
+                return True
 
-        for name in self.layout.hats:
-            self.write_event(ecodes.EV_ABS, name, 0)
+        for attr, table in self.mouse_analogs:
+            if table[getattr(report, attr)]:
+                return True
 
-        self.device.syn()
+        return False
 
     def emit_mouse(self, report):
         """Calculates relative mouse values from a report and writes them."""
@@ -382,20 +614,13 @@ class UInputDevice(object):
                 self.mouse_pos[name] = pos
 
             elif "analog" in attr:
-                pos = getattr(report, attr)
-                if (pos > (128 + self.mouse_analog_deadzone)
-                    or pos < (128 - self.mouse_analog_deadzone)):
-                    accel = (pos - 128) / 10
-                else:
+                # Sensitivity, direction, deadzone and curve are all in
+                # the table of the stick
+                accel = self.mouse_tables[name][getattr(report, attr)]
+                if not accel:
                     continue
 
-                # If a minus modifier has been given then minus the acceleration
-                # to invert the direction.
-                if (modifier and modifier == "-"):
-                    accel = -accel
-
-                sensitivity = self.mouse_analog_sensitivity
-                self.mouse_rel[name] += accel * sensitivity
+                self.mouse_rel[name] += accel
 
             # Emulate mouse wheel (needs special handling)
             if name in (ecodes.REL_WHEELUP, ecodes.REL_WHEELDOWN):
@@ -421,7 +646,7 @@ class UInputDevice(object):
                         elif now - last_write > self.scroll_repeat_delay:
                             write = True
                     if write:
-                        self.device.write(ecodes.EV_REL, ecode, value)
+                        self.write(ecodes.EV_REL, ecode, value)
                         self._scroll_details['last_write'] = now
                         self._scroll_details['count'] += 1
                         continue # No need to proceed further
@@ -433,18 +658,29 @@ class UInputDevice(object):
 
             rel = int(self.mouse_rel[name])
             self.mouse_rel[name] = self.mouse_rel[name] - rel
-            self.device.write(ecodes.EV_REL, name, rel)
 
-        self.device.syn()
+            # The kernel drops relative events without movement
+            if rel:
+                self.write(ecodes.EV_REL, name, rel)
 
+        self.syn()
 
-def create_uinput_device(mapping):
-    """Creates a uinput device."""
+
+def create_uinput_device(mapping, sensors=False):
+    """Creates a uinput device.
+
+    Axes mapped to the motion sensors are left out unless sensors is True.
+    """
     if mapping not in _mappings:
         raise DeviceError("Unknown device mapping: {0}".format(mapping))
 
+    mapping = _mappings[mapping]
+    if not sensors:
+        axes = dict((name, attr) for name, attr in mapping.axes.items()
+                    if attr not in SENSOR_FIELDS)
+        mapping = mapping._replace(axes=axes)
+
     try:
-        mapping = _mappings[mapping]
         device = UInputDevice(mapping)
     except UInputError as err:
         raise DeviceError(err)
@@ -453,13 +689,24 @@ def create_uinput_device(mapping):
 
 
 def parse_uinput_mapping(name, mapping):
-    """Parses a dict of mapping options."""
+    """Parses a dict of mapping options.
+
+    Raises ValueError for response options that don't fit their event.
+    """
     axes, buttons, mouse, mouse_options = {}, {}, {}, {}
+    responses = {}
     description = "ds4drv custom mapping ({0})".format(name)
 
     for key, attr in mapping.items():
         key = key.upper()
-        if key.startswith("BTN_") or key.startswith("KEY_"):
+        option = None
+        if key.startswith(("BTN_", "KEY_", "ABS_", "REL_")):
+            option = parse_response_option(key)
+
+        if option:
+            event, option = option
+            responses.setdefault(event, Response()).set_option(option, attr)
+        elif key.startswith("BTN_") or key.startswith("KEY_"):
             buttons[key] = attr
         elif key.startswith("ABS_"):
             axes[key] = attr
@@ -468,8 +715,34 @@ def parse_uinput_mapping(name, mapping):
         elif key.startswith("MOUSE_"):
             mouse_options[key] = attr
 
+    for event, response in responses.items():
+        if event in axes:
+            response.check(axes[event])
+            continue
+
+        attr = buttons.get(event) or mouse.get(event)
+        if not attr:
+            raise ValueError("Response options for unmapped {0}"
+                             .format(event))
+
+        attr, modifier = parse_button(attr)
+        if event in buttons and not modifier:
+            raise ValueError("Only analog buttons with a direction have "
+                             "a deadzone: {0}".format(event))
+
+        response.check(attr)
+        if event in buttons and (response.curve or response.antideadzone or
+                                 response.radial_deadzone):
+            raise ValueError("Analog buttons only have a deadzone: {0}"
+                             .format(event))
+
+        if event in mouse and response.radial_deadzone:
+            raise ValueError("Radial deadzones only apply to axes: {0}"
+                             .format(event))
+
     create_mapping(name, description, axes=axes, buttons=buttons,
-                   mouse=mouse, mouse_options=mouse_options)
+                   mouse=mouse, mouse_options=mouse_options,
+                   responses=responses)
 
 
 def next_joystick_device():